@@ -1,30 +1,163 @@
+import sys
 import tkinter as tk
 from tkinter import messagebox, simpledialog
-import datetime
-
-assets = [
-    {"Item ID": 1, "Item Name": "HP Elitebook 840 G8", "Item Type": "Laptop", "In-use": False, "Serial Number": 1,
-     "Price": 750.00, "Location": "IT", "Date added": "01-01-2024"},
-    {"Item ID": 2, "Item Name": "Zebra MC3300", "Item Type": "Scanner", "In-use": True, "Serial Number": 2,
-     "Price": 500.00, "Location": "Pick", "Date added": "14-02-2020"},
-    # Add more items as needed
-]
-
-def validate_date(date_str):
-    try:
-        datetime.datetime.strptime(date_str, '%d-%m-%Y')
-        return True
-    except ValueError:
-        return False
+from AssetStore import SortedIds
+from AssetEngine import DEFAULT_DB_PATH, format_asset, open_store, parse_field, validate_date
+from Instrumentation import instrument_tk, timed
 
+
+class VirtualListbox:
+    """A Listbox that only holds the rows in view plus a few either side.
+
+    The full list is a sorted view of Item IDs (SortedIds or PagedIds) and
+    row text is built on demand, so scrolling and edits cost the same with
+    100 or a million assets.
+    The scrollbar is driven from our own position rather than the Listbox's,
+    and the selection is remembered as an Item ID so it survives scrolling
+    and edits elsewhere in the list.
+    """
+
+    def __init__(self, parent, format_row, width=50, height=15, overscan=10):
+        self.format_row = format_row
+        self.height = height
+        self.overscan = overscan
+        self.ids = SortedIds([])
+        self.top = 0
+        self.first = 0
+        self.last = 0
+        self.selected = None
+
+        self.listbox = tk.Listbox(parent, width=width, height=height, exportselection=False)
+        self.scrollbar = tk.Scrollbar(parent, orient=tk.VERTICAL, command=self.yview)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.listbox.bind(sequence, self._on_wheel)
+        self.listbox.bind("<Up>", lambda event: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda event: self._move_selection(1))
+        self.listbox.bind("<Prior>", lambda event: self._move_selection(-self.height))
+        self.listbox.bind("<Next>", lambda event: self._move_selection(self.height))
+
+    def _render(self):
+        """Rebuild the Listbox from the window of rows around the top of the view."""
+        self.first = max(0, self.top - self.overscan)
+        self.last = min(len(self.ids), self.top + self.height + self.overscan)
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *(self.format_row(item_id) for item_id in self.ids[self.first:self.last]))
+        self._show_selection()
+
+    def _show_selection(self):
+        self.listbox.selection_clear(0, tk.END)
+        pos = self.ids.position(self.selected) if self.selected is not None else None
+        if pos is not None and self.first <= pos < self.last:
+            self.listbox.selection_set(pos - self.first)
+        self.listbox.yview(self.top - self.first)
+
+    def _update_scrollbar(self):
+        count = len(self.ids)
+        if count:
+            self.scrollbar.set(self.top / count, min(1.0, (self.top + self.height) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, len(self.ids) - self.height))
+        if self.top < self.first or min(self.top + self.height, len(self.ids)) > self.last:
+            self._render()
+        else:
+            # Still inside the overscan, so just shift the Listbox view.
+            self.listbox.yview(self.top - self.first)
+        self._update_scrollbar()
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.ids)))
+        elif args[0] == "scroll":
+            step = self.height if args[2] == "pages" else 1
+            self.scroll_to(self.top + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self.scroll_to(self.top + direction * 3)
+        return "break"
+
+    def _on_select(self, event):
+        selected = self.listbox.curselection()
+        self.selected = self.ids[self.first + selected[0]] if selected else None
+
+    def _move_selection(self, step):
+        if not self.ids:
+            return "break"
+        pos = self.ids.position(self.selected) if self.selected is not None else None
+        pos = max(0, min(len(self.ids) - 1, self.top if pos is None else pos + step))
+        self.selected = self.ids[pos]
+        if pos < self.top:
+            self.scroll_to(pos)
+        elif pos >= self.top + self.height:
+            self.scroll_to(pos - self.height + 1)
+        self._show_selection()
+        return "break"
+
+    def set_ids(self, ids):
+        """Show a new sorted view of Item IDs, e.g. after a search."""
+        self.ids = ids
+        if self.selected is not None and self.ids.position(self.selected) is None:
+            self.selected = None
+        self.top = 0
+        self._render()
+        self._update_scrollbar()
+
+    def insert(self, item_id):
+        pos = self.ids.insert(item_id)
+        if pos < self.last or self.last - self.first < self.height + self.overscan:
+            self._render()
+        self._update_scrollbar()
+
+    def update(self, item_id):
+        """Redraw one row if it is in the window."""
+        pos = self.ids.position(item_id)
+        if pos is not None and self.first <= pos < self.last:
+            row = pos - self.first
+            self.listbox.delete(row)
+            self.listbox.insert(row, self.format_row(item_id))
+            self._show_selection()
+
+    def remove(self, item_id):
+        pos = self.ids.remove(item_id)
+        if pos is None:
+            return
+        if self.selected == item_id:
+            self.selected = None
+        if pos < self.last:
+            self.top = max(0, min(self.top, len(self.ids) - self.height))
+            self._render()
+        self._update_scrollbar()
+
+
+# Set up by main()
+store = None
+asset_view = None
+search_entry = None
+valuation_report = None
+
+def format_row(item_id):
+    return format_asset(store.get(item_id))
+
+@timed
 def refresh_list():
-    asset_list.delete(0, tk.END)
-    for item in assets:
-        asset_list.insert(tk.END, f"{item['Item ID']}: {item['Item Name']} ({item['Item Type']})")
+    query = search_entry.get().strip()
+    asset_view.set_ids(store.view(query))
+
+def selected_id():
+    if asset_view.selected is None:
+        messagebox.showerror("Error", "No item selected.")
+    return asset_view.selected
+
+def clear_search():
+    search_entry.delete(0, tk.END)
+    refresh_list()
 
 def add_item():
-    new_item = {}
-    new_item["Item ID"] = max(item["Item ID"] for item in assets) + 1 if assets else 1
+    new_item = {"Item ID": None}  # allocated by the store when the item is added
 
     new_item["Item Name"] = simpledialog.askstring("Input", "Enter Item Name:")
     if not new_item["Item Name"]:
@@ -50,83 +183,136 @@ def add_item():
     in_use = simpledialog.askstring("Input", "Is it in-use? (True/False):")
     new_item["In-use"] = in_use.lower() == "true"
 
-    assets.append(new_item)
+    item_id = store.add(new_item)
     messagebox.showinfo("Success", "Item added successfully!")
-    refresh_list()
+    if search_entry.get().strip():
+        refresh_list()
+    else:
+        asset_view.insert(item_id)
 
 def view_item():
-    selected = asset_list.curselection()
-    if not selected:
-        messagebox.showerror("Error", "No item selected.")
+    item_id = selected_id()
+    if item_id is None:
         return
-    item = assets[selected[0]]
+    item = store.get(item_id)
     details = "\n".join(f"{key}: {value}" for key, value in item.items())
     messagebox.showinfo("Item Details", details)
 
 def delete_item():
-    selected = asset_list.curselection()
-    if not selected:
-        messagebox.showerror("Error", "No item selected.")
+    item_id = selected_id()
+    if item_id is None:
         return
-    assets.pop(selected[0])
+    store.delete(item_id)
     messagebox.showinfo("Success", "Item deleted successfully!")
-    refresh_list()
+    if search_entry.get().strip():
+        refresh_list()
+    else:
+        asset_view.remove(item_id)
 
 def edit_item():
-    selected = asset_list.curselection()
-    if not selected:
-        messagebox.showerror("Error", "No item selected.")
+    item_id = selected_id()
+    if item_id is None:
         return
 
-    item = assets[selected[0]]
+    item = store.get(item_id)
+    changes = {}
 
     for key in item:
         if key not in ["Item ID"]:  # Skip immutable fields
             new_value = simpledialog.askstring("Input", f"Enter new value for {key} (current: {item[key]}):")
             if new_value:
-                if key == "Date added" and not validate_date(new_value):
-                    messagebox.showerror("Error", "Invalid date format.")
-                    continue
-                elif key == "Price":
-                    new_value = float(new_value)
-                elif key == "Serial Number":
-                    new_value = int(new_value)
-                elif key == "In-use":
-                    new_value = new_value.lower() == "true"
-
-                item[key] = new_value
+                try:
+                    changes[key] = parse_field(key, new_value)
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
 
+    store.update(item_id, changes)
     messagebox.showinfo("Success", "Item updated successfully!")
+    if search_entry.get().strip():
+        refresh_list()
+    else:
+        asset_view.update(item_id)
+
+@timed
+def show_report():
+    global valuation_report
+    from AssetReports import ValuationReport, format_report
+
+    # Kept between clicks; it only recomputes after the assets change
+    if valuation_report is None:
+        valuation_report = ValuationReport(store)
+    text = format_report(valuation_report.compute())
+
+    report_window = tk.Toplevel()
+    report_window.title("Valuation Report")
+    report_text = tk.Text(report_window, width=75, height=25, font=("Courier", 10))
+    report_text.insert(tk.END, text)
+    report_text.config(state=tk.DISABLED)
+    report_text.pack(padx=10, pady=10)
+
+def undo_change():
+    entry = store.undo()
+    if entry is None:
+        messagebox.showinfo("Undo", "Nothing to undo.")
+        return
     refresh_list()
 
-# GUI Setup
-root = tk.Tk()
-root.title("Asset Management")
+def main(db_path=DEFAULT_DB_PATH):
+    global store, asset_view, search_entry
+    store = open_store(db_path, seed=True)
+
+    # GUI Setup
+    root = tk.Tk()
+    root.title("Asset Management")
+    instrument_tk(root)
+
+    search_frame = tk.Frame(root)
+    search_frame.pack(pady=(10, 0))
+
+    tk.Label(search_frame, text="Search (e.g. Location=IT, In-use=true):").pack(side=tk.LEFT)
+    search_entry = tk.Entry(search_frame, width=30)
+    search_entry.pack(side=tk.LEFT, padx=5)
+    search_entry.bind("<Return>", lambda event: refresh_list())
 
-frame = tk.Frame(root)
-frame.pack(pady=10)
+    search_button = tk.Button(search_frame, text="Search", command=refresh_list)
+    search_button.pack(side=tk.LEFT)
 
-asset_list = tk.Listbox(frame, width=50, height=15)
-asset_list.pack(side=tk.LEFT, padx=10)
+    clear_button = tk.Button(search_frame, text="Clear", command=clear_search)
+    clear_button.pack(side=tk.LEFT, padx=5)
 
-scrollbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=asset_list.yview)
-scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-asset_list.config(yscrollcommand=scrollbar.set)
+    frame = tk.Frame(root)
+    frame.pack(pady=10)
 
-button_frame = tk.Frame(root)
-button_frame.pack(pady=10)
+    asset_view = VirtualListbox(frame, format_row, width=50, height=15)
+    asset_view.listbox.pack(side=tk.LEFT, padx=10)
+    asset_view.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-add_button = tk.Button(button_frame, text="Add Item", command=add_item)
-add_button.grid(row=0, column=0, padx=5)
+    button_frame = tk.Frame(root)
+    button_frame.pack(pady=10)
 
-view_button = tk.Button(button_frame, text="View Item", command=view_item)
-view_button.grid(row=0, column=1, padx=5)
+    add_button = tk.Button(button_frame, text="Add Item", command=add_item)
+    add_button.grid(row=0, column=0, padx=5)
 
-edit_button = tk.Button(button_frame, text="Edit Item", command=edit_item)
-edit_button.grid(row=0, column=2, padx=5)
+    view_button = tk.Button(button_frame, text="View Item", command=view_item)
+    view_button.grid(row=0, column=1, padx=5)
 
-delete_button = tk.Button(button_frame, text="Delete Item", command=delete_item)
-delete_button.grid(row=0, column=3, padx=5)
+    edit_button = tk.Button(button_frame, text="Edit Item", command=edit_item)
+    edit_button.grid(row=0, column=2, padx=5)
+
+    delete_button = tk.Button(button_frame, text="Delete Item", command=delete_item)
+    delete_button.grid(row=0, column=3, padx=5)
+
+    report_button = tk.Button(button_frame, text="Report", command=show_report)
+    report_button.grid(row=0, column=4, padx=5)
+
+    # Only a journal directory keeps the history undo needs
+    if hasattr(store, "undo"):
+        undo_button = tk.Button(button_frame, text="Undo", command=undo_change)
+        undo_button.grid(row=0, column=5, padx=5)
+
+    refresh_list()
+    root.mainloop()
+    store.close()
 
-refresh_list()
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH)
@@ -0,0 +1,382 @@
+import argparse
+import csv
+import datetime
+from functools import lru_cache
+import json
+import os
+import re
+import sys
+import time
+
+from AssetStore import BOOLEAN_VALUES, FIELD_COLUMNS, SQLiteAssetStore
+from Instrumentation import timed
+
+DEFAULT_DB_PATH = "assets.db"
+BATCH_SIZE = 5000
+DATE_PATTERN = re.compile(r"(\d{1,2})-(\d{1,2})-(\d{4})")
+READ_ONLY_COMMANDS = ("list", "show", "report", "export", "history")
+
+# Put into a new, empty database so there is something to look at
+SEED_ASSETS = [
+    {"Item ID": 1, "Item Name": "HP Elitebook 840 G8", "Item Type": "Laptop", "In-use": False, "Serial Number": 1,
+     "Price": 750.00, "Location": "IT", "Date added": "01-01-2024"},
+    {"Item ID": 2, "Item Name": "Zebra MC3300", "Item Type": "Scanner", "In-use": True, "Serial Number": 2,
+     "Price": 500.00, "Location": "Pick", "Date added": "14-02-2020"},
+]
+
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str):
+    """Parse a DD-MM-YYYY date, or return None if it is not a real date.
+
+    Uses a pre-compiled pattern instead of strptime, and caches results
+    because bulk files repeat the same few dates over and over.
+    """
+    match = DATE_PATTERN.fullmatch(date_str.strip())
+    if not match:
+        return None
+    day, month, year = match.groups()
+    try:
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def validate_date(date_str):
+    return date_str is not None and parse_date(date_str) is not None
+
+
+def parse_field(field, text):
+    """Convert the text typed for one field into the value stored for it.
+
+    Raises ValueError if the text is not valid for that field.
+    """
+    if field == "Item ID":
+        raise ValueError("Item ID cannot be changed")
+    if field == "Date added":
+        if not validate_date(text):
+            raise ValueError("Invalid date format.")
+        return text.strip()
+    if field == "Price":
+        return float(text)
+    if field == "Serial Number":
+        return int(text)
+    if field == "In-use":
+        return text.strip().lower() == "true"
+    if field not in FIELD_COLUMNS:
+        raise ValueError(f"Unknown field {field!r}")
+    return text
+
+
+def format_asset(item):
+    """One-line summary of an asset, as shown in the list."""
+    return f"{item['Item ID']}: {item['Item Name']} ({item['Item Type']})"
+
+
+def open_store(db_path=DEFAULT_DB_PATH, seed=False, create=True):
+    """Open the asset database.
+
+    A path ending in .db is a SQLite database; anything else is a journal
+    directory for a JournaledAssetStore, which keeps the register in memory
+    and supports undo and change history. With `seed` an empty register
+    gets the demo assets; without `create` a missing database raises
+    ValueError instead of being made.
+    """
+    if not create and not os.path.exists(db_path):
+        raise ValueError(f"{db_path} does not exist")
+    if db_path.endswith(".db"):
+        store = SQLiteAssetStore(db_path)
+    else:
+        from AssetJournal import JournaledAssetStore
+
+        store = JournaledAssetStore(db_path)
+    if seed and not len(store):
+        store.add_many(dict(item) for item in SEED_ASSETS)
+    return store
+
+
+def format_change(entry):
+    """One line describing a journal entry."""
+    if entry["op"] == "edit":
+        changes = ", ".join(f"{field}: {entry['before'][field]} -> {value}" for field, value in entry["after"].items())
+        return f"#{entry['seq']} edit Item ID {entry['id']}: {changes}"
+    return f"#{entry['seq']} {entry['op']} {format_asset(entry['item'])}"
+
+
+def add_asset(store, fields):
+    """Validate a dict of field values and add it as a new asset. Returns the Item ID."""
+    item = coerce_item({**fields, "Item ID": None})
+    return store.add(item)
+
+
+def edit_asset(store, item_id, changes):
+    """Apply text field changes to an asset. Returns the updated asset."""
+    return store.update(item_id, {field: parse_field(field, text) for field, text in changes.items()})
+
+
+def delete_asset(store, item_id):
+    return store.delete(item_id)
+
+
+def coerce_item(row):
+    """Turn a row of strings (or JSON values) into a typed asset dict.
+
+    Raises ValueError naming the first field that is missing or invalid.
+    """
+    item = {}
+    item_id = row.get("Item ID")
+    if item_id in (None, ""):
+        item["Item ID"] = None
+    else:
+        # int() would quietly turn 1.7 into 1 and overwrite a different asset
+        if isinstance(item_id, float) and item_id.is_integer():
+            item_id = int(item_id)
+        try:
+            item["Item ID"] = int(str(item_id).strip())
+        except ValueError:
+            raise ValueError(f"Item ID must be a whole number, not {row.get('Item ID')!r}") from None
+
+    for field in ("Item Name", "Item Type"):
+        value = str(row.get(field) or "").strip()
+        if not value:
+            raise ValueError(f"{field} cannot be empty")
+        item[field] = value
+
+    in_use = str(row.get("In-use", "false")).strip().lower()
+    if in_use not in BOOLEAN_VALUES:
+        raise ValueError(f"In-use must be True or False, not {row.get('In-use')!r}")
+    item["In-use"] = BOOLEAN_VALUES[in_use]
+
+    try:
+        serial_number = row.get("Serial Number")
+        item["Serial Number"] = int(serial_number) if serial_number not in (None, "") else None
+        price = row.get("Price")
+        item["Price"] = float(price) if price not in (None, "") else None
+    except ValueError:
+        raise ValueError("Serial Number and Price must be numbers") from None
+
+    item["Location"] = str(row.get("Location") or "").strip()
+
+    date_added = str(row.get("Date added") or "")
+    if parse_date(date_added) is None:
+        raise ValueError(f"Date added must be DD-MM-YYYY, not {date_added!r}")
+    item["Date added"] = date_added.strip()
+    return item
+
+
+def detect_format(path, file_format=None):
+    """Pick csv or jsonl from an explicit choice or the file extension."""
+    if file_format:
+        return file_format
+    return "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".json", ".ndjson") else "csv"
+
+
+def read_rows(path, file_format=None):
+    """Stream (line number, row dict) pairs from a CSV or JSON Lines file.
+
+    A JSON line that doesn't parse comes through as the ValueError in
+    place of its row, so one bad line doesn't end the file.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if file_format == "jsonl":
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError as e:
+                        yield line_number, e
+        else:
+            yield from enumerate(csv.DictReader(f), start=2)
+
+
+@timed
+def import_assets(path, store, file_format=None, batch_size=BATCH_SIZE, progress=None):
+    """Stream assets from a CSV or JSON Lines file into a store, in batches.
+
+    Rows with an Item ID that already exists update that asset; every other
+    row is added. Each batch is written in one transaction. `progress` is
+    called with (rows imported, rows rejected) after every batch.
+    Returns the same pair once the file is done.
+    """
+    file_format = detect_format(path, file_format)
+    imported = 0
+    rejected = 0
+    batch = []
+
+    def flush():
+        with store.batch():
+            for item in batch:
+                if item["Item ID"] is not None and item["Item ID"] in store:
+                    store.update(item["Item ID"], item)
+                else:
+                    store.add(item)
+        batch.clear()
+
+    for line_number, row in read_rows(path, file_format):
+        try:
+            if isinstance(row, ValueError):
+                raise row
+            batch.append(coerce_item(row))
+        except (ValueError, AttributeError) as e:
+            rejected += 1
+            print(f"{path}:{line_number}: {e}", file=sys.stderr)
+            continue
+        if len(batch) >= batch_size:
+            imported += len(batch)
+            flush()
+            if progress:
+                progress(imported, rejected)
+    if batch:
+        imported += len(batch)
+        flush()
+    if progress:
+        progress(imported, rejected)
+    return imported, rejected
+
+
+@timed
+def export_assets(path, store, file_format=None, progress=None, progress_every=BATCH_SIZE):
+    """Stream every asset in a store out to a CSV or JSON Lines file. Returns the row count."""
+    file_format = detect_format(path, file_format)
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = None if file_format == "jsonl" else csv.DictWriter(f, fieldnames=list(FIELD_COLUMNS))
+        if writer:
+            writer.writeheader()
+        for item in store:
+            if writer:
+                writer.writerow(item)
+            else:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            count += 1
+            if progress and count % progress_every == 0:
+                progress(count)
+    if progress:
+        progress(count)
+    return count
+
+
+def report_progress(verb):
+    """Build a progress callback that prints a running count and rate."""
+    start = time.perf_counter()
+
+    def progress(count, rejected=None):
+        rate = count / max(time.perf_counter() - start, 1e-9)
+        extra = f", {rejected} rejected" if rejected else ""
+        print(f"{verb} {count} assets{extra} ({rate:,.0f}/s)", file=sys.stderr)
+
+    return progress
+
+
+def field_pairs(pairs):
+    """Turn ["Location=IT", ...] into {"Location": "IT", ...}."""
+    fields = {}
+    for pair in pairs:
+        field, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Expected FIELD=VALUE, got {pair!r}")
+        fields[field.strip()] = value
+    return fields
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Asset register tools that run without a display.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help=f"asset database, or a journal directory (default {DEFAULT_DB_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="add or update assets from a CSV or JSON Lines file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), help="defaults to the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    list_parser = commands.add_parser("list", help="list assets, optionally filtered")
+    list_parser.add_argument("--search", default="", help='e.g. "Location=IT, In-use=true"')
+
+    show_parser = commands.add_parser("show", help="print every field of one asset")
+    show_parser.add_argument("item_id", type=int)
+
+    add_parser = commands.add_parser("add", help="add an asset from field=value pairs")
+    add_parser.add_argument("fields", nargs="+", metavar="FIELD=VALUE")
+
+    edit_parser = commands.add_parser("edit", help="change fields of an asset")
+    edit_parser.add_argument("item_id", type=int)
+    edit_parser.add_argument("fields", nargs="+", metavar="FIELD=VALUE")
+
+    delete_parser = commands.add_parser("delete", help="delete an asset")
+    delete_parser.add_argument("item_id", type=int)
+
+    report_parser = commands.add_parser("report", help="depreciation and book value across the register")
+    report_parser.add_argument("--as-of", help="DD-MM-YYYY, defaults to today")
+    report_parser.add_argument("--life", type=float, default=4.0, help="useful life in years (default 4)")
+    report_parser.add_argument("--rate", type=float, help="yearly declining-balance rate (default 2 / life)")
+    report_parser.add_argument("--salvage", type=float, default=0.0, help="fraction of cost never written off")
+    report_parser.add_argument("--json", action="store_true", help="print the figures as JSON")
+
+    export_parser = commands.add_parser("export", help="write every asset to a CSV or JSON Lines file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"), help="defaults to the file extension")
+
+    history_parser = commands.add_parser("history", help="list journaled changes (journal directories only)")
+    history_parser.add_argument("item_id", type=int, nargs="?", help="only changes to this asset")
+
+    commands.add_parser("undo", help="reverse the last journaled change (journal directories only)")
+
+    args = parser.parse_args(argv)
+    try:
+        # Commands that only read shouldn't leave a new database behind for a mistyped --db
+        store = open_store(args.db, create=args.command not in READ_ONLY_COMMANDS)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "list":
+            for item_id in store.search(args.search) if args.search else store.ids():
+                print(format_asset(store.get(item_id)))
+        elif args.command == "show":
+            print("\n".join(f"{key}: {value}" for key, value in store.get(args.item_id).items()))
+        elif args.command == "add":
+            print(f"Added Item ID {add_asset(store, field_pairs(args.fields))}")
+        elif args.command == "edit":
+            print(format_asset(edit_asset(store, args.item_id, field_pairs(args.fields))))
+        elif args.command == "delete":
+            print(f"Deleted {format_asset(delete_asset(store, args.item_id))}")
+        elif args.command == "report":
+            from AssetReports import ValuationReport, format_report
+
+            as_of = None
+            if args.as_of:
+                as_of = parse_date(args.as_of)
+                if as_of is None:
+                    raise ValueError(f"--as-of must be DD-MM-YYYY, not {args.as_of!r}")
+            result = ValuationReport(store).compute(as_of, args.life, args.rate, args.salvage)
+            print(json.dumps(result, indent=2, ensure_ascii=False) if args.json else format_report(result))
+        elif args.command == "import":
+            imported, rejected = import_assets(args.path, store, args.format, args.batch_size,
+                                               progress=report_progress("Imported"))
+            print(f"Imported {imported} assets from {args.path}, rejected {rejected} rows.")
+            return 1 if rejected else 0
+        elif args.command == "export":
+            count = export_assets(args.path, store, args.format, progress=report_progress("Exported"))
+            print(f"Exported {count} assets to {args.path}.")
+        elif args.command in ("history", "undo"):
+            if not hasattr(store, "undo"):
+                raise ValueError(f"{args.db} has no change journal; use a journal directory")
+            if args.command == "history":
+                for entry in store.history(args.item_id):
+                    print(format_change(entry))
+            else:
+                entry = store.undo()
+                print(f"Undid {format_change(entry)}" if entry else "Nothing to undo.")
+    except KeyError as e:
+        print(f"Error: no asset with Item ID {e.args[0]}", file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
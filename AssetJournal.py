@@ -0,0 +1,275 @@
+import json
+import os
+import pickle
+import re
+import threading
+from contextlib import contextmanager
+
+from AssetStore import AssetStore
+from Instrumentation import timed
+
+SEGMENT_PATTERN = re.compile(r"^journal-(\d+)\.log$")
+COMPACT_EVERY = 10000
+
+
+class JournaledAssetStore(AssetStore):
+    """An in-memory AssetStore made durable by an append-only journal.
+
+    Every add, edit and delete is written as one JSON line (with the old
+    values of edited fields) and fsynced before it is applied, so a change
+    costs one small append however big the register is. Every
+    `compact_every` changes the journal rolls over to a new segment and a
+    background thread pickles the state as it was at that point into
+    `snapshot.bin`. Start-up loads the snapshot and replays only the
+    segments written after it.
+
+    Old segments are kept as an audit trail unless `keep_history` is off,
+    and the recorded old values make `undo()` possible.
+    """
+
+    def __init__(self, journal_dir, compact_every=COMPACT_EVERY, keep_history=True, sync=True):
+        super().__init__()
+        self.journal_dir = journal_dir
+        self.snapshot_path = os.path.join(journal_dir, "snapshot.bin")
+        self.compact_every = compact_every
+        self.keep_history = keep_history
+        self.sync = sync
+        self.seq = 0
+        self.undo_stack = []
+        self._lock = threading.Lock()
+        self._journal = None
+        self._since_snapshot = 0
+        self._batch_depth = 0
+        self._undoing = None
+        self._compaction = None
+        os.makedirs(journal_dir, exist_ok=True)
+        self._load()
+
+    def _segments(self):
+        """(first seq, path) of every journal segment, oldest first."""
+        segments = []
+        for name in os.listdir(self.journal_dir):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(self.journal_dir, name)))
+        return sorted(segments)
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.journal_dir, f"journal-{first_seq:012d}.log")
+
+    @timed
+    def _load(self):
+        """Load the latest snapshot, then replay the journal written after it."""
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                state = pickle.load(f)
+            snapshot_seq = state["seq"]
+            for item in state["assets"].values():
+                AssetStore.add(self, item)
+            self.next_id = state["next_id"]
+        self.seq = snapshot_seq
+
+        segments = self._segments()
+        # Segments that end before the snapshot are only kept for the audit trail.
+        start = 0
+        for i, (first_seq, _) in enumerate(segments):
+            if first_seq <= snapshot_seq + 1:
+                start = i
+        for first_seq, path in segments[start:]:
+            for entry in self._read_segment(path, repair=True):
+                if entry["seq"] > self.seq:
+                    self._apply(entry)
+                    self.seq = entry["seq"]
+                    if "undo" in entry:
+                        # An undo always reverses the newest change still on the stack
+                        if self.undo_stack and self.undo_stack[-1]["seq"] == entry["undo"]:
+                            self.undo_stack.pop()
+                    else:
+                        self.undo_stack.append(entry)
+                    self._since_snapshot += 1
+
+        path = segments[-1][1] if segments else self._segment_path(self.seq + 1)
+        self._journal = open(path, "ab")
+        if self._journal.tell():
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                ended = f.read(1) == b"\n"
+            if not ended:
+                # The last entry is whole but lost its newline; end it so the next append starts a new line.
+                self._journal.write(b"\n")
+                self._flush()
+
+    @staticmethod
+    def _read_segment(path, repair=False):
+        """Yield the entries of a segment, dropping a torn last line if `repair` is set.
+
+        A crash mid-append can only leave a last line with no newline. Any
+        other bad line means the file is damaged, so it raises ValueError
+        rather than throw entries away.
+        """
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if line.endswith(b"\n"):
+                        raise ValueError(f"{path} is damaged at byte {offset}; the bad entry is complete, "
+                                         f"so it was not cut off by a crash") from None
+                    if repair:
+                        # A crash mid-append leaves a partial last line; cut it off.
+                        f.close()
+                        with open(path, "r+b") as g:
+                            g.truncate(offset)
+                    return
+                offset += len(line)
+                yield entry
+
+    def _apply(self, entry):
+        """Apply a journal entry to memory without journaling it again."""
+        op = entry["op"]
+        if op == "add":
+            AssetStore.add(self, dict(entry["item"]))
+        elif op == "edit":
+            self.assets[entry["id"]] = dict(self.assets[entry["id"]])
+            AssetStore.update(self, entry["id"], entry["after"])
+        elif op == "delete":
+            AssetStore.delete(self, entry["id"])
+
+    def _record(self, entry):
+        """Append an entry to the journal and make it durable."""
+        with self._lock:
+            self.seq += 1
+            entry["seq"] = self.seq
+            if self._undoing is not None:
+                entry["undo"] = self._undoing
+            self._journal.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            if self._batch_depth == 0:
+                self._flush()
+            self._since_snapshot += 1
+            if self._undoing is None:
+                self.undo_stack.append(entry)
+
+    def _applied(self, result):
+        """Called once a recorded change is in memory; snapshots only ever see applied changes."""
+        if self._since_snapshot >= self.compact_every:
+            self.compact()
+        return result
+
+    def _flush(self):
+        self._journal.flush()
+        if self.sync:
+            os.fsync(self._journal.fileno())
+
+    @contextmanager
+    def batch(self):
+        """Defer the fsync to the end of the block: one durable write for many changes."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                with self._lock:
+                    self._flush()
+
+    def add(self, item):
+        if item.get("Item ID") is None:
+            item["Item ID"] = self.allocate_id()
+        elif item["Item ID"] in self.assets:
+            raise ValueError(f"Item ID {item['Item ID']} already exists")
+        self._record({"op": "add", "item": item})
+        return self._applied(super().add(item))
+
+    def add_many(self, items):
+        with self.batch():
+            return super().add_many(items)
+
+    def update(self, item_id, changes):
+        old = self.assets[item_id]
+        changes = {key: value for key, value in changes.items() if key != "Item ID"}
+        if not changes:
+            return old  # Nothing to journal or undo
+        before = {key: old.get(key) for key in changes}
+        self._record({"op": "edit", "id": item_id, "before": before, "after": changes})
+        # Copy on write, so a snapshot being pickled never sees half an edit.
+        self.assets[item_id] = dict(old)
+        return self._applied(super().update(item_id, changes))
+
+    def delete(self, item_id):
+        item = self.assets[item_id]
+        self._record({"op": "delete", "id": item_id, "item": item})
+        return self._applied(super().delete(item_id))
+
+    def undo(self):
+        """Reverse the most recent change still on the undo stack.
+
+        The reversal is journaled like any other change, marked with the
+        seq it undoes, so undo carries on where it left off after a restart.
+        It reaches back as far as the last snapshot, which empties the stack.
+        Returns the entry that
+        was undone, or None if there is nothing left to undo.
+        """
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        self._undoing = entry["seq"]
+        try:
+            if entry["op"] == "add":
+                self.delete(entry["item"]["Item ID"])
+            elif entry["op"] == "edit":
+                self.update(entry["id"], entry["before"])
+            elif entry["op"] == "delete":
+                self.add(dict(entry["item"]))
+        finally:
+            self._undoing = None
+        return entry
+
+    def history(self, item_id=None):
+        """Yield every journaled change, or only those to one asset, oldest first."""
+        for _, path in self._segments():
+            for entry in self._read_segment(path):
+                entry_id = entry["item"]["Item ID"] if entry["op"] == "add" else entry["id"]
+                if item_id is None or entry_id == item_id:
+                    yield entry
+
+    @timed
+    def compact(self, wait=False):
+        """Start a new journal segment and snapshot the state in the background."""
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._flush()
+            self._journal.close()
+            self._journal = open(self._segment_path(self.seq + 1), "ab")
+            # Items are never changed in place, so a shallow copy is a consistent picture.
+            state = {"seq": self.seq, "next_id": self.next_id, "assets": dict(self.assets)}
+            self._since_snapshot = 0
+            # Undo stops at the snapshot, so drop what it no longer needs to keep.
+            self.undo_stack.clear()
+            self._compaction = threading.Thread(target=self._write_snapshot, args=(state,), daemon=True)
+            self._compaction.start()
+        if wait:
+            self._compaction.join()
+
+    def _write_snapshot(self, state):
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        if not self.keep_history:
+            for first_seq, path in self._segments():
+                if first_seq <= state["seq"]:
+                    os.remove(path)
+
+    def close(self):
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            if self._journal is not None:
+                self._flush()
+                self._journal.close()
+                self._journal = None
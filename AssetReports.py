@@ -0,0 +1,148 @@
+import datetime
+
+import numpy as np
+
+from AssetEngine import parse_date
+from Instrumentation import timed
+
+# Upper bounds (in years) of the age buckets; the last bucket is open ended
+AGE_BUCKETS = (1, 3, 5)
+
+
+def bucket_labels(bounds=AGE_BUCKETS):
+    labels = [f"0-{bounds[0]} years"]
+    labels += [f"{low}-{high} years" for low, high in zip(bounds, bounds[1:])]
+    labels.append(f"{bounds[-1]}+ years")
+    return labels
+
+
+class AssetColumns:
+    """The fields reports need, parsed once into numpy columns.
+
+    Locations and item types are stored as integer codes into the
+    `locations` and `item_types` lists so they can be grouped with bincount.
+    """
+
+    def __init__(self, store):
+        prices = []
+        days = []
+        locations = []
+        item_types = []
+        for price, date_added, location, item_type in store.values(("Price", "Date added", "Location",
+                                                                   "Item Type")):
+            date = parse_date(date_added) if date_added else None
+            prices.append(price or 0.0)
+            days.append(date.toordinal() if date else -1)
+            locations.append(location or "")
+            item_types.append(item_type or "")
+
+        self.price = np.array(prices, dtype=np.float64)
+        # -1 marks a missing or invalid date; those assets count as brand new
+        self.added_day = np.array(days, dtype=np.int64)
+        self.locations, self.location_code = np.unique(np.array(locations, dtype=object), return_inverse=True)
+        self.item_types, self.item_type_code = np.unique(np.array(item_types, dtype=object), return_inverse=True)
+
+    def __len__(self):
+        return len(self.price)
+
+
+class ValuationReport:
+    """Estate-wide depreciation and book value figures for an asset store.
+
+    The columns are rebuilt only when the store's version changes, and
+    results are cached per set of parameters until then, so asking for the
+    same report again after no edits is free.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._version = None
+        self._columns = None
+        self._results = {}
+
+    def columns(self):
+        version = self.store.version
+        if self._columns is None or version != self._version:
+            self._columns = AssetColumns(self.store)
+            self._version = version
+            self._results = {}
+        return self._columns
+
+    @timed
+    def compute(self, as_of=None, useful_life=4.0, rate=None, salvage=0.0):
+        """Work out cost, straight-line and declining-balance book values.
+
+        `useful_life` is in years, `rate` is the yearly declining-balance
+        rate (double the straight-line rate by default) and `salvage` is the
+        fraction of cost an asset is never written down below. Raises
+        ValueError for a life that isn't positive, or a rate or salvage
+        outside 0-1.
+        """
+        if useful_life <= 0:
+            raise ValueError(f"Useful life must be more than 0 years, not {useful_life}")
+        if rate is not None and not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Declining-balance rate must be between 0 and 1, not {rate}")
+        if not 0.0 <= salvage <= 1.0:
+            raise ValueError(f"Salvage must be a fraction of cost between 0 and 1, not {salvage}")
+        as_of = as_of or datetime.date.today()
+        # Double declining balance goes past 100% a year for lives under two years
+        rate = min(2.0 / useful_life, 1.0) if rate is None else rate
+        columns = self.columns()
+        key = (as_of, useful_life, rate, salvage)
+        if key in self._results:
+            return self._results[key]
+
+        price = columns.price
+        age_days = np.where(columns.added_day >= 0, as_of.toordinal() - columns.added_day, 0)
+        age_years = np.clip(age_days, 0, None) / 365.25
+        floor = price * salvage
+
+        straight_line = price - (price - floor) * np.minimum(age_years / useful_life, 1.0)
+        declining_balance = np.maximum(price * (1.0 - rate) ** age_years, floor)
+        bucket = np.digitize(age_years, AGE_BUCKETS)
+
+        def grouped(codes, labels):
+            groups = {}
+            count = np.bincount(codes, minlength=len(labels))
+            cost = np.bincount(codes, weights=price, minlength=len(labels))
+            sl = np.bincount(codes, weights=straight_line, minlength=len(labels))
+            db = np.bincount(codes, weights=declining_balance, minlength=len(labels))
+            for i, label in enumerate(labels):
+                if count[i]:
+                    groups[label] = {"count": int(count[i]), "cost": float(cost[i]),
+                                     "straight_line": float(sl[i]), "declining_balance": float(db[i])}
+            return groups
+
+        result = {
+            "as_of": as_of.isoformat(),
+            "useful_life": useful_life,
+            "rate": rate,
+            "salvage": salvage,
+            "assets": len(columns),
+            "cost": float(price.sum()),
+            "straight_line": float(straight_line.sum()),
+            "declining_balance": float(declining_balance.sum()),
+            "by_location": grouped(columns.location_code, [str(x) for x in columns.locations]),
+            "by_item_type": grouped(columns.item_type_code, [str(x) for x in columns.item_types]),
+            "by_age": grouped(bucket, bucket_labels()),
+        }
+        self._results[key] = result
+        return result
+
+
+def format_report(result):
+    """Lay a report out as plain text tables for the CLI and the GUI."""
+    lines = [
+        f"Valuation as of {result['as_of']} ({result['useful_life']:g} year life, "
+        f"{result['rate']:.0%} declining rate, {result['salvage']:.0%} salvage)",
+        f"{result['assets']} assets costing £{result['cost']:,.2f}",
+        f"Book value, straight line:     £{result['straight_line']:,.2f}",
+        f"Book value, declining balance: £{result['declining_balance']:,.2f}",
+    ]
+    for title, key in (("Location", "by_location"), ("Item Type", "by_item_type"), ("Age", "by_age")):
+        lines.append("")
+        lines.append(f"{title:<20} {'Count':>7} {'Cost':>14} {'Straight line':>14} {'Declining':>14}")
+        for label, group in result[key].items():
+            lines.append(f"{(label or '(none)')[:20]:<20} {group['count']:>7} {group['cost']:>14,.2f} "
+                         f"{group['straight_line']:>14,.2f} {group['declining_balance']:>14,.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,519 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import sqlite3
+
+from Instrumentation import timed
+
+INDEXED_FIELDS = ("Location", "Item Type", "In-use", "Serial Number")
+BOOLEAN_VALUES = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+# How many rows PagedIds will skip reading on from its last page before it uses OFFSET instead
+KEYSET_GAP = 1000
+# Asset fields in display order and the SQLite columns they are stored in
+FIELD_COLUMNS = {
+    "Item ID": "item_id",
+    "Item Name": "item_name",
+    "Item Type": "item_type",
+    "In-use": "in_use",
+    "Serial Number": "serial_number",
+    "Price": "price",
+    "Location": "location",
+    "Date added": "date_added",
+}
+
+
+def index_key(value):
+    """Normalise a field value so lookups ignore case and type (True/"true", 1/"1")."""
+    return str(value).strip().lower()
+
+
+def lookup_key(field, value):
+    """The index key a search for `value` in `field` looks up, or None if it can't match anything.
+
+    In-use accepts the same spellings as import (yes/no, 1/0).
+    """
+    key = index_key(value)
+    if field == "In-use":
+        return index_key(BOOLEAN_VALUES[key]) if key in BOOLEAN_VALUES else None
+    return key
+
+
+def parse_query(query):
+    """Split a search box query into `{field: value}` criteria and free words.
+
+    Terms are separated by commas. `field=value` terms filter on that
+    indexed field, bare terms match any indexed field.
+    """
+    criteria = {}
+    words = []
+    lower_fields = {field.lower(): field for field in INDEXED_FIELDS}
+    for term in query.split(","):
+        term = term.strip()
+        if not term:
+            continue
+        field, sep, value = term.partition("=")
+        if sep and field.strip().lower() in lower_fields:
+            criteria[lower_fields[field.strip().lower()]] = value.strip()
+        else:
+            words.append(term)
+    return criteria, words
+
+
+class SortedIds:
+    """A sorted list of Item IDs with the lookups VirtualListbox needs."""
+
+    def __init__(self, ids):
+        self.ids = list(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return self.ids[index]
+
+    def position(self, item_id):
+        pos = bisect_left(self.ids, item_id)
+        return pos if pos < len(self.ids) and self.ids[pos] == item_id else None
+
+    def insert(self, item_id):
+        """Add an Item ID, returning the position it went in at."""
+        pos = bisect_left(self.ids, item_id)
+        self.ids.insert(pos, item_id)
+        return pos
+
+    def remove(self, item_id):
+        """Drop an Item ID, returning the position it was at, or None if absent."""
+        pos = self.position(item_id)
+        if pos is not None:
+            del self.ids[pos]
+        return pos
+
+
+class AssetStore:
+    """Assets keyed by Item ID, with secondary indexes on the fields we filter by.
+
+    Every index maps a normalised field value to the set of Item IDs holding
+    it, so lookups, adds, edits and deletes cost the same however many
+    assets there are.
+    """
+
+    def __init__(self, assets=()):
+        self.assets = {}
+        self.next_id = 1
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        # Bumped on every write so cached reports know when to recompute
+        self.version = 0
+        for item in assets:
+            self.add(item)
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def batch(self):
+        """Nothing to group in memory; here so both stores share one interface."""
+        yield self
+
+    def __len__(self):
+        return len(self.assets)
+
+    def __contains__(self, item_id):
+        return item_id in self.assets
+
+    def __iter__(self):
+        return iter(self.assets.values())
+
+    def ids(self):
+        """All Item IDs in ascending order."""
+        return sorted(self.assets)
+
+    def values(self, fields):
+        """Yield a tuple of the given fields for every asset."""
+        for item in self.assets.values():
+            yield tuple(item.get(field) for field in fields)
+
+    def get(self, item_id):
+        return self.assets[item_id]
+
+    def allocate_id(self):
+        item_id = self.next_id
+        self.next_id += 1
+        return item_id
+
+    def _index(self, item):
+        for field in INDEXED_FIELDS:
+            if field in item:
+                self.indexes[field].setdefault(index_key(item[field]), set()).add(item["Item ID"])
+
+    def _unindex(self, item, fields=INDEXED_FIELDS):
+        for field in fields:
+            if field not in item:
+                continue
+            key = index_key(item[field])
+            ids = self.indexes[field].get(key)
+            if ids is not None:
+                ids.discard(item["Item ID"])
+                if not ids:
+                    del self.indexes[field][key]
+
+    def add(self, item):
+        """Store an asset, giving it the next Item ID if it has none. Returns the Item ID."""
+        if item.get("Item ID") is None:
+            item["Item ID"] = self.allocate_id()
+        elif item["Item ID"] in self.assets:
+            raise ValueError(f"Item ID {item['Item ID']} already exists")
+        else:
+            self.next_id = max(self.next_id, item["Item ID"] + 1)
+        self.assets[item["Item ID"]] = item
+        self._index(item)
+        self.version += 1
+        return item["Item ID"]
+
+    @timed
+    def add_many(self, items):
+        """Add many assets. Returns how many were added."""
+        count = 0
+        for item in items:
+            self.add(item)
+            count += 1
+        return count
+
+    def update(self, item_id, changes):
+        """Change some fields of an asset, keeping the indexes in step."""
+        item = self.assets[item_id]
+        changes = {key: value for key, value in changes.items() if key != "Item ID"}
+        self._unindex(item, [field for field in INDEXED_FIELDS if field in changes])
+        item.update(changes)
+        self._index({"Item ID": item_id, **{field: item[field] for field in INDEXED_FIELDS
+                                            if field in changes}})
+        self.version += 1
+        return item
+
+    def delete(self, item_id):
+        item = self.assets.pop(item_id)
+        self._unindex(item)
+        self.version += 1
+        return item
+
+    def match(self, criteria, words=()):
+        """Item IDs matching every `field: value` pair and every free word.
+
+        A free word matches an asset when any indexed field equals it.
+        """
+        candidates = []
+        for field, value in criteria.items():
+            if field not in self.indexes:
+                raise KeyError(f"{field} is not an indexed field")
+            candidates.append(self.indexes[field].get(lookup_key(field, value), set()))
+        for word in words:
+            candidates.append(set().union(*(index.get(lookup_key(field, word), ())
+                                            for field, index in self.indexes.items())))
+
+        if not candidates:
+            return self.ids()
+        candidates.sort(key=len)
+        result = set(candidates[0]).intersection(*candidates[1:])
+        return sorted(result)
+
+    def search(self, query):
+        """Answer a search box query such as "Location=IT, In-use=true" or "laptop"."""
+        criteria, words = parse_query(query)
+        return self.match(criteria, words)
+
+    @timed
+    def view(self, query=""):
+        """Sorted Item IDs for the list view, filtered by a search query."""
+        return SortedIds(self.search(query) if query else self.ids())
+
+
+class PagedIds:
+    """Sorted Item IDs matching a filter, read from SQLite a page at a time.
+
+    Has the same interface as SortedIds, so VirtualListbox can show a
+    million-row table without ever loading all of its IDs. The last page
+    read is kept, and pages near it are read on from its first or last
+    Item ID rather than with OFFSET, which costs time in proportion to how
+    far down the table the page is.
+    """
+
+    def __init__(self, connection, where="", params=()):
+        self.connection = connection
+        self.where = where
+        self.params = tuple(params)
+        self._count = None
+        self._window_start = 0
+        self._window = []  # The Item IDs last read, from position _window_start on
+
+    def _query(self, sql, params=()):
+        where = f"WHERE {self.where}" if self.where else ""
+        return self.connection.execute(sql.format(where=where), self.params + tuple(params))
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self._query("SELECT COUNT(*) FROM assets {where}").fetchone()[0]
+        return self._count
+
+    def _read_from(self, item_id, count, before=False):
+        """Up to `count` Item IDs after (or, going backwards, before) an Item ID."""
+        extra = "AND" if self.where else "WHERE"
+        sql = (f"SELECT item_id FROM assets {{where}} {extra} item_id {'<' if before else '>'} ? "
+               f"ORDER BY item_id {'DESC' if before else ''} LIMIT ?")
+        ids = [row[0] for row in self._query(sql, (item_id, count))]
+        return ids[::-1] if before else ids
+
+    def _read(self, start, stop):
+        window, first = self._window, self._window_start
+        end = first + len(window)
+        if window and first <= start and stop <= end:
+            return window[start - first:stop - first]
+        if window and first <= start <= end + KEYSET_GAP:
+            after = self._read_from(window[-1], stop - end)
+            return window[start - first:] + after[max(0, start - end):]
+        if window and start < first and first - KEYSET_GAP <= stop <= end:
+            before = self._read_from(window[0], first - start, before=True)
+            if len(before) == first - start:
+                return (before + window)[:stop - start]
+        # A jump, e.g. from dragging the scrollbar
+        rows = self._query("SELECT item_id FROM assets {where} ORDER BY item_id LIMIT ? OFFSET ?",
+                           (stop - start, start))
+        return [row[0] for row in rows]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(len(self))
+            if stop <= start:
+                return []
+            self._window = self._read(start, stop)
+            self._window_start = start
+            return list(self._window)
+        if index < 0:
+            index += len(self)
+        ids = self._read(index, index + 1) if index >= 0 else []
+        if not ids:
+            raise IndexError("asset view index out of range")
+        return ids[0]
+
+    def _rows_before(self, item_id):
+        extra = "AND" if self.where else "WHERE"
+        return self._query(f"SELECT COUNT(*) FROM assets {{where}} {extra} item_id < ?", (item_id,)).fetchone()[0]
+
+    def position(self, item_id):
+        pos = bisect_left(self._window, item_id)
+        if pos < len(self._window) and self._window[pos] == item_id:
+            return self._window_start + pos
+        extra = "AND" if self.where else "WHERE"
+        if self._query(f"SELECT 1 FROM assets {{where}} {extra} item_id = ?", (item_id,)).fetchone() is None:
+            return None
+        return self._rows_before(item_id)
+
+    # The row has already been written to or deleted from the database by the
+    # time these are called, so they only move the cached count. Both assume
+    # the row matches (or matched) this view's filter.
+    def insert(self, item_id):
+        if self._count is not None:
+            self._count += 1
+        self._window = []
+        return self._rows_before(item_id)
+
+    def remove(self, item_id):
+        if self._count is not None:
+            self._count -= 1
+        self._window = []
+        return self._rows_before(item_id)
+
+
+class SQLiteAssetStore:
+    """Assets kept in a SQLite database, with the same interface as AssetStore.
+
+    The database runs in WAL mode with indexes on the fields we filter by.
+    Each write commits on its own unless it happens inside `batch()`, which
+    wraps everything in one transaction. Nothing is read up front: the list
+    view pages through Item IDs and rows are fetched as they are shown.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS assets (
+                item_id INTEGER PRIMARY KEY,
+                item_name TEXT,
+                item_type TEXT,
+                in_use INTEGER,
+                serial_number INTEGER,
+                price REAL,
+                location TEXT,
+                date_added TEXT
+            );
+            CREATE INDEX IF NOT EXISTS assets_location ON assets (location COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS assets_item_type ON assets (item_type COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS assets_in_use ON assets (in_use);
+            CREATE INDEX IF NOT EXISTS assets_serial_number ON assets (serial_number);
+        """)
+        self._batch_depth = 0
+        self._count = None
+        self._writes = 0
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def version(self):
+        """Changes whenever the assets change, here or through another connection."""
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        return self._writes, data_version
+
+    @contextmanager
+    def batch(self):
+        """Group every write inside the block into a single transaction."""
+        if self._batch_depth == 0:
+            self.connection.execute("BEGIN")
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.connection.execute("ROLLBACK")
+                self._count = None
+                self._writes += 1
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self.connection.execute("COMMIT")
+
+    @staticmethod
+    def _row_to_item(row):
+        item = dict(zip(FIELD_COLUMNS, row))
+        item["In-use"] = bool(item["In-use"])
+        return item
+
+    @staticmethod
+    def _column_value(field, value):
+        return int(bool(value)) if field == "In-use" else value
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self.connection.execute("SELECT COUNT(*) FROM assets").fetchone()[0]
+        return self._count
+
+    def __contains__(self, item_id):
+        return self.connection.execute("SELECT 1 FROM assets WHERE item_id = ?", (item_id,)).fetchone() is not None
+
+    def __iter__(self):
+        columns = ", ".join(FIELD_COLUMNS.values())
+        for row in self.connection.execute(f"SELECT {columns} FROM assets ORDER BY item_id"):
+            yield self._row_to_item(row)
+
+    def ids(self):
+        """All Item IDs in ascending order."""
+        return [row[0] for row in self.connection.execute("SELECT item_id FROM assets ORDER BY item_id")]
+
+    def values(self, fields):
+        """Yield a tuple of the given fields for every asset, straight from the table."""
+        columns = ", ".join(FIELD_COLUMNS[field] for field in fields)
+        yield from self.connection.execute(f"SELECT {columns} FROM assets")
+
+    def get(self, item_id):
+        columns = ", ".join(FIELD_COLUMNS.values())
+        row = self.connection.execute(f"SELECT {columns} FROM assets WHERE item_id = ?", (item_id,)).fetchone()
+        if row is None:
+            raise KeyError(item_id)
+        return self._row_to_item(row)
+
+    def add(self, item):
+        """Store an asset, letting SQLite pick the next Item ID if it has none. Returns the Item ID."""
+        fields = [field for field in FIELD_COLUMNS if field in item]
+        columns = ", ".join(FIELD_COLUMNS[field] for field in fields)
+        placeholders = ", ".join("?" for _ in fields)
+        try:
+            cursor = self.connection.execute(
+                f"INSERT INTO assets ({columns}) VALUES ({placeholders})",
+                [self._column_value(field, item[field]) for field in fields]
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Item ID {item['Item ID']} already exists") from None
+        item["Item ID"] = cursor.lastrowid
+        self._writes += 1
+        if self._count is not None:
+            self._count += 1
+        return item["Item ID"]
+
+    @timed
+    def add_many(self, items):
+        """Add many assets in one transaction. Returns how many were added."""
+        count = 0
+        with self.batch():
+            for item in items:
+                self.add(item)
+                count += 1
+        return count
+
+    def update(self, item_id, changes):
+        changes = {field: value for field, value in changes.items() if field in FIELD_COLUMNS and field != "Item ID"}
+        if changes:
+            assignments = ", ".join(f"{FIELD_COLUMNS[field]} = ?" for field in changes)
+            self.connection.execute(
+                f"UPDATE assets SET {assignments} WHERE item_id = ?",
+                [self._column_value(field, value) for field, value in changes.items()] + [item_id]
+            )
+            self._writes += 1
+        return self.get(item_id)
+
+    def delete(self, item_id):
+        item = self.get(item_id)
+        self.connection.execute("DELETE FROM assets WHERE item_id = ?", (item_id,))
+        self._writes += 1
+        if self._count is not None:
+            self._count -= 1
+        return item
+
+    def _where(self, criteria, words):
+        """Build a WHERE clause that the field indexes can answer."""
+        clauses = []
+        params = []
+
+        def condition(field, value):
+            column = FIELD_COLUMNS[field]
+            if field == "In-use":
+                key = lookup_key(field, value)
+                return (f"{column} = ?", [int(key == "true")]) if key is not None else ("0", [])
+            if field == "Serial Number":
+                try:
+                    return f"{column} = ?", [int(value)]
+                except ValueError:
+                    return "0", []
+            return f"{column} = ? COLLATE NOCASE", [str(value).strip()]
+
+        for field, value in criteria.items():
+            if field not in INDEXED_FIELDS:
+                raise KeyError(f"{field} is not an indexed field")
+            clause, clause_params = condition(field, value)
+            clauses.append(clause)
+            params += clause_params
+        for word in words:
+            alternatives = []
+            for field in INDEXED_FIELDS:
+                if field == "In-use" and lookup_key(field, word) is None:
+                    continue
+                clause, clause_params = condition(field, word)
+                alternatives.append(clause)
+                params += clause_params
+            clauses.append("(" + " OR ".join(alternatives) + ")")
+        return " AND ".join(clauses), params
+
+    def match(self, criteria, words=()):
+        where, params = self._where(criteria, words)
+        return list(PagedIds(self.connection, where, params)[:])
+
+    def search(self, query):
+        """Answer a search box query such as "Location=IT, In-use=true" or "laptop"."""
+        criteria, words = parse_query(query)
+        return self.match(criteria, words)
+
+    @timed
+    def view(self, query=""):
+        """Sorted Item IDs for the list view, paged lazily from the database."""
+        where, params = self._where(*parse_query(query))
+        return PagedIds(self.connection, where, params)
@@ -0,0 +1,363 @@
+import os
+import sqlite3
+import struct
+import threading
+
+from Instrumentation import timed
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".music_player")
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "durations.db")
+HEADER_BYTES = 64 * 1024
+
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = (44100, 48000, 32000)
+
+
+def id3_size(header):
+    """Length of an ID3v2 tag at the start of a file, or 0 if there is none."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    # Bit 4 of the flags means a 10-byte footer follows the tag
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def parse_mp3_frame(header):
+    """(version, layer, bitrate kbps, sample rate, channel mode) of a frame header, or None."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[rate_index] // {1: 1, 2: 2, 2.5: 4}[version]
+    return version, layer, bitrate, sample_rate, header[3] >> 6
+
+
+def mp3_duration(f, file_size):
+    """Seconds of MP3 audio from the Xing/Info or VBRI header, else assuming constant bitrate."""
+    header = f.read(HEADER_BYTES)
+    start = id3_size(header)
+    if start:
+        f.seek(start)
+        header = f.read(HEADER_BYTES)
+
+    for offset in range(len(header) - 4):
+        frame = parse_mp3_frame(header[offset:offset + 4])
+        if frame is not None:
+            break
+    else:
+        return None
+    version, layer, bitrate, sample_rate, channel_mode = frame
+    samples_per_frame = 384 if layer == 1 else 1152 if layer == 2 or version == 1 else 576
+
+    # A VBR encoder writes the frame count into a tag inside the first frame
+    mono = channel_mode == 3
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if header[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", header[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", header[xing + 8:xing + 12])[0]
+            return frames * samples_per_frame / sample_rate
+    vbri = offset + 36
+    if header[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", header[vbri + 14:vbri + 18])[0]
+        return frames * samples_per_frame / sample_rate
+
+    audio_bytes = file_size - start - offset
+    f.seek(-128, os.SEEK_END)
+    if f.read(3) == b"TAG":
+        audio_bytes -= 128
+    return audio_bytes * 8 / (bitrate * 1000)
+
+
+def wav_duration(f, file_size):
+    """Seconds of audio in a RIFF WAVE file, from its fmt and data chunks."""
+    header = f.read(12)
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    byte_rate = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size + (chunk_size & 1))
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # Streamed WAVs leave the size at 0 or 0xFFFFFFFF; take the rest of the file
+            if chunk_size in (0, 0xFFFFFFFF):
+                chunk_size = file_size - f.tell()
+            return chunk_size / byte_rate
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def flac_duration(f, file_size):
+    """Seconds of audio from a FLAC file's STREAMINFO block."""
+    header = f.read(HEADER_BYTES)
+    start = id3_size(header)
+    if header[start:start + 4] != b"fLaC":
+        return None
+    # STREAMINFO is always the first block: 4-byte block header, then 10 bytes
+    # of block/frame sizes, then 20 bits of sample rate ... 36 bits of sample count
+    info = header[start + 8:start + 8 + 34]
+    if len(info) < 18:
+        return None
+    packed = struct.unpack(">Q", info[10:18])[0]
+    sample_rate = packed >> 44
+    total_samples = packed & ((1 << 36) - 1)
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / sample_rate
+
+
+def ogg_duration(f, file_size):
+    """Seconds of Vorbis or Opus audio: the last page's granule position over the sample rate."""
+    header = f.read(HEADER_BYTES)
+    if header[:4] != b"OggS":
+        return None
+    pre_skip = 0
+    vorbis = header.find(b"\x01vorbis")
+    opus = header.find(b"OpusHead")
+    if vorbis != -1:
+        sample_rate = struct.unpack("<I", header[vorbis + 12:vorbis + 16])[0]
+    elif opus != -1:
+        # Opus granule positions always count 48 kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack("<H", header[opus + 10:opus + 12])[0]
+    else:
+        return None
+
+    f.seek(max(0, file_size - HEADER_BYTES))
+    tail = f.read()
+    last_page = tail.rfind(b"OggS")
+    if last_page == -1 or len(tail) < last_page + 14 or not sample_rate:
+        return None
+    granule = struct.unpack("<q", tail[last_page + 6:last_page + 14])[0]
+    if granule <= 0:
+        return None
+    return (granule - pre_skip) / sample_rate
+
+
+DURATION_READERS = {
+    ".mp3": mp3_duration,
+    ".wav": wav_duration,
+    ".flac": flac_duration,
+    ".ogg": ogg_duration,
+    ".opus": ogg_duration,
+}
+
+
+def read_duration(file_path):
+    """Track length in seconds from the file's headers, or None if they don't say.
+
+    Only reads the first and, for Ogg, last few kilobytes of the file.
+    """
+    reader = DURATION_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            return reader(f, os.fstat(f.fileno()).st_size)
+    except (OSError, struct.error):
+        return None
+
+
+ID3_TEXT_FRAMES = {
+    b"TIT2": "title", b"TPE1": "artist", b"TALB": "album",
+    b"TT2": "title", b"TP1": "artist", b"TAL": "album",
+}
+ID3_ENCODINGS = ("latin-1", "utf-16", "utf-16-be", "utf-8")
+VORBIS_FIELDS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album"}
+
+
+def decode_id3_text(data):
+    if not data or data[0] > 3:
+        return ""
+    text = data[1:].decode(ID3_ENCODINGS[data[0]], "replace").strip("\x00").strip()
+    # ID3v2.4 separates the values of a multi-value frame with NULs
+    return " / ".join(value.strip() for value in text.split("\x00") if value.strip())
+
+
+def id3_tags(header):
+    """Title, artist and album from an ID3v2 tag at the start of `header`."""
+    tags = {}
+    end = id3_size(header)
+    if not end:
+        return tags
+    version, flags = header[3], header[5]
+    offset = 10
+    if flags & 0x40 and version >= 3:
+        # Skip the extended header
+        offset += struct.unpack(">I", header[10:14])[0] + (0 if version == 4 else 4)
+    id_size, head_size = (3, 6) if version == 2 else (4, 10)
+    end = min(end, len(header))
+    while offset + head_size <= end:
+        frame_id = header[offset:offset + id_size]
+        if not frame_id.strip(b"\x00"):
+            break  # Padding
+        if version == 2:
+            size = int.from_bytes(header[offset + 3:offset + 6], "big")
+        elif version == 4:
+            b = header[offset + 4:offset + 8]
+            size = (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+        else:
+            size = struct.unpack(">I", header[offset + 4:offset + 8])[0]
+        field = ID3_TEXT_FRAMES.get(frame_id)
+        if field:
+            tags[field] = decode_id3_text(header[offset + head_size:offset + head_size + size])
+        offset += head_size + size
+    return tags
+
+
+def vorbis_comments(data):
+    """Title, artist and album from a Vorbis comment block (FLAC, Ogg Vorbis, Opus)."""
+    tags = {}
+    vendor_length = struct.unpack("<I", data[:4])[0]
+    offset = 4 + vendor_length
+    count = struct.unpack("<I", data[offset:offset + 4])[0]
+    offset += 4
+    for _ in range(count):
+        length = struct.unpack("<I", data[offset:offset + 4])[0]
+        key, _, value = data[offset + 4:offset + 4 + length].decode("utf-8", "replace").partition("=")
+        field = VORBIS_FIELDS.get(key.upper())
+        if field and field not in tags:
+            tags[field] = value.strip()
+        offset += 4 + length
+    return tags
+
+
+def flac_tags(header):
+    offset = id3_size(header)
+    if header[offset:offset + 4] != b"fLaC":
+        return {}
+    offset += 4
+    while offset + 4 <= len(header):
+        block_type = header[offset] & 0x7F
+        size = int.from_bytes(header[offset + 1:offset + 4], "big")
+        if block_type == 4:
+            return vorbis_comments(header[offset + 4:offset + 4 + size])
+        if header[offset] & 0x80:
+            break  # That was the last metadata block
+        offset += 4 + size
+    return {}
+
+
+def ogg_tags(header):
+    for marker in (b"\x03vorbis", b"OpusTags"):
+        start = header.find(marker)
+        if start != -1:
+            return vorbis_comments(header[start + len(marker):])
+    return {}
+
+
+def mp3_tags(f, header):
+    tags = id3_tags(header)
+    if not tags:
+        # Fall back to an ID3v1 tag in the last 128 bytes
+        f.seek(-128, os.SEEK_END)
+        tail = f.read(128)
+        if tail[:3] == b"TAG":
+            for field, start in (("title", 3), ("artist", 33), ("album", 63)):
+                value = tail[start:start + 30].split(b"\x00")[0].decode("latin-1").strip()
+                if value:
+                    tags[field] = value
+    return tags
+
+
+def read_tags(file_path):
+    """Title, artist and album as far as the file's tags give them.
+
+    Understands ID3v2/ID3v1 (MP3) and Vorbis comments (FLAC, Ogg, Opus);
+    anything missing is simply left out.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(HEADER_BYTES)
+            if extension == ".mp3":
+                return mp3_tags(f, header)
+            if extension == ".flac":
+                return flac_tags(header)
+            if extension in (".ogg", ".opus"):
+                return ogg_tags(header)
+    except (OSError, struct.error, IndexError):
+        pass
+    return {}
+
+
+def decode_duration(file_path):
+    """Track length found by decoding the whole file. Slow; keep it off the UI thread."""
+    from pygame import mixer
+
+    return mixer.Sound(file_path).get_length()
+
+
+class DurationCache:
+    """Track lengths saved in SQLite, keyed by path and checked against mtime and size.
+
+    Safe to share between the UI thread and a background decoder.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS durations "
+            "(path TEXT PRIMARY KEY, mtime REAL, size INTEGER, seconds REAL)"
+        )
+        self.lock = threading.Lock()
+
+    def get(self, file_path):
+        """The cached length of a file, or None if it is missing or the file has changed."""
+        stat = os.stat(file_path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT seconds FROM durations WHERE path = ? AND mtime = ? AND size = ?",
+                (file_path, stat.st_mtime, stat.st_size)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, file_path, seconds):
+        stat = os.stat(file_path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?)",
+                (file_path, stat.st_mtime, stat.st_size, seconds)
+            )
+
+    @timed
+    def duration(self, file_path):
+        """Length from the cache or the file's headers, or None if only decoding will tell."""
+        seconds = self.get(file_path)
+        if seconds is None:
+            seconds = read_duration(file_path)
+            if seconds is not None:
+                self.put(file_path, seconds)
+        return seconds
+
+    def decode(self, file_path):
+        """Decode a file to find its length, and remember the answer."""
+        seconds = decode_duration(file_path)
+        self.put(file_path, seconds)
+        return seconds
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,615 @@
+import argparse
+import contextlib
+import csv
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from Instrumentation import latency_summary, peak_rss_kb
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "coding-projects-benchmarks")
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+SEED = 2024
+# Allowed slowdown (or growth in memory) against the baseline before a result counts as a regression
+TOLERANCE = 0.25
+LATENCY_SAMPLES = 200
+ALBUM_SIZE = 12
+
+# Data set sizes: "small" runs in a minute or so, "full" matches the sizes people have reported trouble with
+SCALES = {
+    "small": {"expenses": 200_000, "assets": 50_000, "tracks": 200, "playlist": 100_000, "qr_codes": 2_000},
+    "full": {"expenses": 5_000_000, "assets": 1_000_000, "tracks": 5_000, "playlist": 1_000_000,
+             "qr_codes": 100_000},
+}
+# (metric, True if higher is better) compared against the baseline
+METRICS = (("per_second", True), ("latency.p95_ms", False), ("peak_rss_kb", False))
+
+EXPENSE_CATEGORIES = ("Food 🍔", "Home 🏠", "Transport 🚗", "Entertainment 🎮", "Health 🏥", "Education 📚",
+                      "Miscellaneous 🛒")
+EXPENSE_NAMES = ("Tesco", "Sainsbury's", "TfL", "Netflix", "Boots", "Amazon", "Shell", "Pret, Victoria")
+ASSET_TYPES = ("Laptop", "Scanner", "Monitor", "Phone", "Printer", "Tablet", "Headset")
+ASSET_LOCATIONS = ("IT", "Pick", "Pack", "Goods In", "Office", "Despatch", "Returns")
+ASSET_QUERIES = ("", "Location=IT", "Item Type=Laptop", "In-use=true", "scanner",
+                 "Location=Pick, Item Type=Scanner")
+
+
+def generate_expense_ledger(ledger_dir, rows, months=12, seed=SEED):
+    """Write `rows` random expenses into month partitions laid out as ExpenseLedger keeps them."""
+    rng = random.Random(seed)
+    os.makedirs(ledger_dir, exist_ok=True)
+    for m in range(months):
+        month = f"{2024 + m // 12}-{m % 12 + 1:02d}"
+        count = rows // months + (m < rows % months)
+        with open(os.path.join(ledger_dir, f"{month}.csv"), "w", encoding="utf-8", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerows(
+                (f"{month}-{rng.randint(1, 28):02d}", rng.choice(EXPENSE_NAMES), rng.randint(50, 20000) / 100,
+                 rng.choice(EXPENSE_CATEGORIES))
+                for _ in range(count)
+            )
+
+
+def generate_statement(path, rows, seed=SEED):
+    """Write a bank statement export that the default ImportRules can read."""
+    rng = random.Random(seed)
+    start = datetime.date(2024, 1, 1).toordinal()
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "name", "amount"])
+        writer.writerows(
+            (datetime.date.fromordinal(start + rng.randrange(366)).isoformat(), rng.choice(EXPENSE_NAMES),
+             f"{rng.randint(50, 20000) / 100:.2f}")
+            for _ in range(rows)
+        )
+
+
+def generate_assets(path, count, seed=SEED):
+    """Write an asset register of `count` rows as CSV, in the AssetEngine import format."""
+    from AssetStore import FIELD_COLUMNS
+
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELD_COLUMNS)
+        for item_id in range(1, count + 1):
+            item_type = rng.choice(ASSET_TYPES)
+            writer.writerow([item_id, f"{item_type} {rng.randrange(1000):03d}", item_type,
+                             rng.choice(("true", "false")), 100000 + item_id, rng.randint(2000, 300000) / 100,
+                             rng.choice(ASSET_LOCATIONS),
+                             f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(2012, 2025)}"])
+
+
+def generate_audio_files(directory, count, seed=SEED, seconds=1, rate=8000):
+    """Write `count` short mono WAV tones, ALBUM_SIZE to a folder like a ripped CD collection."""
+    from array import array
+    import math
+    import wave
+
+    rng = random.Random(seed)
+    tones = []
+    for frequency in (220, 330, 440, 550, 660, 880):
+        samples = array("h", (int(8000 * math.sin(2 * math.pi * frequency * n / rate)) for n in range(rate * seconds)))
+        if sys.byteorder == "big":
+            samples.byteswap()
+        tones.append(samples.tobytes())
+
+    for i in range(count):
+        album = i // ALBUM_SIZE
+        folder = os.path.join(directory, f"Artist {album // 10:04d}", f"Album {album:05d}")
+        if i % ALBUM_SIZE == 0:
+            os.makedirs(folder, exist_ok=True)
+        with wave.open(os.path.join(folder, f"{i % ALBUM_SIZE + 1:02d} Track {i:06d}.wav"), "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(rng.choice(tones))
+
+
+def generate_qr_payloads(path, count, seed=SEED):
+    """Write a QREngine batch CSV of `count` unique asset-label payloads."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["data", "filename"])
+        writer.writerows((f"ASSET:{i:08d}:{rng.getrandbits(32):08x}", f"asset-{i:08d}") for i in range(count))
+
+
+def prepare_expenses(data_dir, rows, seed):
+    generate_expense_ledger(os.path.join(data_dir, "expenses"), rows, seed=seed)
+    generate_statement(os.path.join(data_dir, "statement.csv"), max(1, rows // 10), seed)
+
+
+def prepare_assets(data_dir, count, seed):
+    from AssetEngine import import_assets
+    from AssetJournal import JournaledAssetStore
+    from AssetStore import SQLiteAssetStore
+
+    csv_path = os.path.join(data_dir, "assets.csv")
+    generate_assets(csv_path, count, seed)
+    # The read benchmarks start from an already imported register in each kind of store
+    store = SQLiteAssetStore(os.path.join(data_dir, "assets.db"))
+    import_assets(csv_path, store)
+    store.close()
+    store = JournaledAssetStore(os.path.join(data_dir, "assets.journal"))
+    import_assets(csv_path, store)
+    store.close()
+
+
+def prepare_tracks(data_dir, count, seed):
+    generate_audio_files(os.path.join(data_dir, "audio"), count, seed)
+
+
+def prepare_qr_codes(data_dir, count, seed):
+    generate_qr_payloads(os.path.join(data_dir, "qr.csv"), count, seed)
+
+
+# Data set -> (files and folders it writes, generator)
+DATASETS = {
+    "expenses": (("expenses", "statement.csv"), prepare_expenses),
+    "assets": (("assets.csv", "assets.db", "assets.db-wal", "assets.db-shm", "assets.journal"), prepare_assets),
+    "tracks": (("audio",), prepare_tracks),
+    "qr_codes": (("qr.csv",), prepare_qr_codes),
+}
+
+
+def prepare(data_dir, sizes, seed=SEED, datasets=DATASETS):
+    """Generate the data sets that are missing or were made with another size or seed.
+
+    What has been generated is recorded in manifest.json, so later runs
+    reuse the same files.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    manifest_path = os.path.join(data_dir, "manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    for name in datasets:
+        outputs, generate = DATASETS[name]
+        wanted = {"size": sizes[name], "seed": seed}
+        if manifest.get(name) == wanted:
+            continue
+        print(f"Generating {name} ({sizes[name]:,}) in {data_dir}...", file=sys.stderr)
+        manifest.pop(name, None)
+        for output in outputs:
+            path = os.path.join(data_dir, output)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        start = time.perf_counter()
+        generate(data_dir, sizes[name], seed)
+        print(f"Generated {name} in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+        manifest[name] = wanted
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def throughput(items, seconds):
+    return {"items": items, "seconds": round(seconds, 3), "per_second": round(items / seconds, 1) if seconds else None}
+
+
+def time_each(func, calls):
+    """Call func(*args) for each args in `calls` and return the latency summary."""
+    durations = []
+    for args in calls:
+        start = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start)
+    return latency_summary(durations)
+
+
+def bench_expense_rebuild(data_dir, sizes, scratch, workers=1):
+    from ExpenseLedger import ExpenseLedger
+
+    ledger = ExpenseLedger(os.path.join(data_dir, "expenses"))
+    start = time.perf_counter()
+    ledger.rebuild(workers=workers)
+    return {**throughput(sizes["expenses"], time.perf_counter() - start), "workers": workers}
+
+
+def bench_expense_rebuild_parallel(data_dir, sizes, scratch):
+    return bench_expense_rebuild(data_dir, sizes, scratch, workers=os.cpu_count() or 1)
+
+
+def bench_expense_summary(data_dir, sizes, scratch):
+    """What summarise_expenses costs per run: a fresh ledger, its refresh and the month's totals."""
+    from Expenses import Expenses
+    from ExpenseLedger import ExpenseLedger
+
+    source = ExpenseLedger(os.path.join(data_dir, "expenses"))
+    month = source.partitions()[-1]
+    ledger_dir = os.path.join(scratch, "expenses")
+    os.makedirs(ledger_dir)
+    shutil.copy(source.partition_path(month), ledger_dir)
+
+    def summarise():
+        ledger = ExpenseLedger(ledger_dir)
+        ledger.refresh(month)
+        ledger.category_totals(month)
+
+    start = time.perf_counter()
+    summarise()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    day = datetime.date.fromisoformat(f"{month}-15")
+    append = time_each(lambda: ExpenseLedger(ledger_dir).append(Expenses("Benchmark", EXPENSE_CATEGORIES[0], 1.0, day)),
+                       [()] * LATENCY_SAMPLES)
+    return {"cold_ms": round(cold_ms, 3), "latency": time_each(summarise, [()] * LATENCY_SAMPLES),
+            "append_latency": append}
+
+
+def bench_expense_load_batch(data_dir, sizes, scratch):
+    from ExpenseLedger import ExpenseLedger
+
+    ledger = ExpenseLedger(os.path.join(data_dir, "expenses"))
+    months = ledger.partitions()
+    start = time.perf_counter()
+    rows = 0
+    for month in months:
+        batch = ledger.load_batch(month)
+        batch.category_totals()
+        rows += len(batch)
+    return throughput(rows, time.perf_counter() - start)
+
+
+def bench_expense_import(data_dir, sizes, scratch):
+    from ExpenseImport import ImportRules, import_statement
+    from ExpenseLedger import ExpenseLedger
+
+    start = time.perf_counter()
+    imported, _ = import_statement(os.path.join(data_dir, "statement.csv"),
+                                   ExpenseLedger(os.path.join(scratch, "expenses")), ImportRules())
+    return throughput(imported, time.perf_counter() - start)
+
+
+def bench_asset_import(data_dir, sizes, scratch, journal=False):
+    from AssetEngine import import_assets
+    from AssetJournal import JournaledAssetStore
+    from AssetStore import SQLiteAssetStore
+
+    if journal:
+        store = JournaledAssetStore(os.path.join(scratch, "assets.journal"))
+    else:
+        store = SQLiteAssetStore(os.path.join(scratch, "assets.db"))
+    start = time.perf_counter()
+    imported, _ = import_assets(os.path.join(data_dir, "assets.csv"), store)
+    store.close()
+    return throughput(imported, time.perf_counter() - start)
+
+
+def bench_asset_import_journal(data_dir, sizes, scratch):
+    return bench_asset_import(data_dir, sizes, scratch, journal=True)
+
+
+def bench_asset_view(data_dir, sizes, scratch):
+    """What refresh_list and a screenful of rows cost: a search, its count and 15 rows from a random offset."""
+    from AssetStore import SQLiteAssetStore
+
+    rng = random.Random(SEED)
+    store = SQLiteAssetStore(os.path.join(data_dir, "assets.db"))
+
+    def show(query):
+        ids = store.view(query)
+        count = len(ids)
+        top = rng.randrange(max(1, count - 15))
+        for index in range(top, min(count, top + 15)):
+            store.get(ids[index])
+
+    latency = time_each(show, [(rng.choice(ASSET_QUERIES),) for _ in range(LATENCY_SAMPLES)])
+    store.close()
+    return {"latency": latency}
+
+
+def bench_asset_journal_load(data_dir, sizes, scratch):
+    from AssetJournal import JournaledAssetStore
+
+    start = time.perf_counter()
+    store = JournaledAssetStore(os.path.join(data_dir, "assets.journal"))
+    seconds = time.perf_counter() - start
+    count = len(store)
+    store.close()
+    return throughput(count, seconds)
+
+
+def bench_asset_valuation(data_dir, sizes, scratch):
+    from AssetReports import ValuationReport
+    from AssetStore import SQLiteAssetStore
+
+    store = SQLiteAssetStore(os.path.join(data_dir, "assets.db"))
+    report = ValuationReport(store)
+    start = time.perf_counter()
+    report.compute()
+    result = throughput(len(store), time.perf_counter() - start)
+    # Other parameters reuse the parsed columns, as a second click on Report would
+    result["latency"] = time_each(report.compute, [(None, 3.0 + i / 100) for i in range(LATENCY_SAMPLES)])
+    store.close()
+    return result
+
+
+def bench_music_scan(data_dir, sizes, scratch):
+    from MusicLibrary import MusicLibrary
+
+    library = MusicLibrary(os.path.join(scratch, "library.db"))
+    start = time.perf_counter()
+    counts = library.scan(os.path.join(data_dir, "audio"))
+    result = throughput(counts["added"], time.perf_counter() - start)
+    start = time.perf_counter()
+    library.scan(os.path.join(data_dir, "audio"))
+    result["rescan_seconds"] = round(time.perf_counter() - start, 3)
+    library.close()
+    return result
+
+
+def audio_files(data_dir, limit=None):
+    paths = []
+    for directory, _, filenames in os.walk(os.path.join(data_dir, "audio")):
+        paths.extend(os.path.join(directory, filename) for filename in filenames)
+    paths.sort()
+    return paths[:limit]
+
+
+def bench_music_durations(data_dir, sizes, scratch):
+    from AudioMetadata import read_duration
+
+    return {"latency": time_each(read_duration, [(path,) for path in audio_files(data_dir)])}
+
+
+def bench_music_peaks(data_dir, sizes, scratch):
+    from Waveform import compute_peaks
+
+    paths = audio_files(data_dir, LATENCY_SAMPLES)
+    compute_peaks(paths[0])  # Imports numpy, which a running player has already paid for
+    return {"latency": time_each(compute_peaks, [(path,) for path in paths])}
+
+
+def bench_music_playlist(data_dir, sizes, scratch):
+    """Fill a playlist, then save and reload it as .mpl and as .m3u."""
+    from Playlist import Playlist
+
+    count = sizes["playlist"]
+    playlist = Playlist()
+    start = time.perf_counter()
+    playlist.extend((f"/music/Artist {i // 120:04d}/Album {i // 12:05d}/{i % 12 + 1:02d} Track {i:07d}.mp3",
+                     f"Artist {i // 120} - Track {i}", 180.0 + i % 120) for i in range(count))
+    result = {"build": throughput(count, time.perf_counter() - start)}
+
+    total = 0.0
+    for extension in ("mpl", "m3u"):
+        path = os.path.join(scratch, f"playlist.{extension}")
+        start = time.perf_counter()
+        playlist.save(path)
+        saved = time.perf_counter()
+        loaded = Playlist()
+        loaded.load(path)
+        end = time.perf_counter()
+        result[f"save_{extension}"] = throughput(count, saved - start)
+        result[f"load_{extension}"] = throughput(len(loaded), end - saved)
+        total += end - start
+    result.update(throughput(count * 4, total))
+    return result
+
+
+def qr_rows(data_dir, limit=None):
+    from itertools import islice
+    from QREngine import read_batch
+
+    rows = read_batch(os.path.join(data_dir, "qr.csv"))
+    return list(islice(rows, limit)) if limit else rows
+
+
+def bench_qr_render(data_dir, sizes, scratch):
+    from QREngine import render_png
+
+    render_png("warm-up")
+    render_png.cache_clear()
+    return {"latency": time_each(render_png, [(data,) for data, _ in qr_rows(data_dir, LATENCY_SAMPLES)])}
+
+
+def bench_qr_batch(data_dir, sizes, scratch):
+    from QREngine import render_batch, write_batch
+
+    start = time.perf_counter()
+    count = write_batch(render_batch(qr_rows(data_dir)), os.path.join(scratch, "codes.zip"))
+    return {**throughput(count, time.perf_counter() - start), "workers": os.cpu_count() or 1}
+
+
+def bench_qr_decode(data_dir, sizes, scratch):
+    from QREngine import decode_image_bytes, render_png
+
+    images = [(render_png(data),) for data, _ in qr_rows(data_dir, LATENCY_SAMPLES)]
+    decode_image_bytes(images[0][0])  # Imports cv2 and builds the detector
+    return {"latency": time_each(decode_image_bytes, images)}
+
+
+# Benchmark name -> (data set it reads, function(data_dir, sizes, scratch_dir) returning its results)
+BENCHMARKS = {
+    "expenses.rebuild": ("expenses", bench_expense_rebuild),
+    "expenses.rebuild_parallel": ("expenses", bench_expense_rebuild_parallel),
+    "expenses.summary": ("expenses", bench_expense_summary),
+    "expenses.load_batch": ("expenses", bench_expense_load_batch),
+    "expenses.import": ("expenses", bench_expense_import),
+    "assets.import_sqlite": ("assets", bench_asset_import),
+    "assets.import_journal": ("assets", bench_asset_import_journal),
+    "assets.view": ("assets", bench_asset_view),
+    "assets.journal_load": ("assets", bench_asset_journal_load),
+    "assets.valuation": ("assets", bench_asset_valuation),
+    "music.scan": ("tracks", bench_music_scan),
+    "music.durations": ("tracks", bench_music_durations),
+    "music.peaks": ("tracks", bench_music_peaks),
+    "music.playlist": (None, bench_music_playlist),
+    "qr.render": ("qr_codes", bench_qr_render),
+    "qr.batch": ("qr_codes", bench_qr_batch),
+    "qr.decode": ("qr_codes", bench_qr_decode),
+}
+
+
+def run_benchmark(name, data_dir, sizes):
+    """Run one benchmark, quietly, in a scratch directory. Meant for a fresh worker process."""
+    with tempfile.TemporaryDirectory() as scratch, open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        result = BENCHMARKS[name][1](data_dir, sizes, scratch)
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+
+def run_isolated(name, data_dir, sizes):
+    """Run a benchmark in its own process, so its peak RSS is its own."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_benchmark, name, data_dir, sizes).result()
+
+
+def metric_value(result, metric):
+    for key in metric.split("."):
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Regressions against the baseline: throughput down, or p95 latency or peak RSS up, by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        for metric, higher_is_better in METRICS:
+            new_value, old_value = metric_value(result, metric), metric_value(old, metric)
+            if not new_value or not old_value:
+                continue
+            change = new_value / old_value - 1
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append({"benchmark": name, "metric": metric, "baseline": old_value,
+                                    "value": new_value, "change": round(change, 3)})
+    return regressions
+
+
+def read_baselines(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, scale, report):
+    """Store a run's results as the baseline for its scale, keeping the other scales' baselines."""
+    baselines = read_baselines(path)
+    stored = baselines.get(scale, {}).get("results", {})
+    stored.update(report["results"])
+    baselines[scale] = {"machine": report["machine"], "sizes": report["sizes"], "created": report["created"],
+                        "results": stored}
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def format_result(name, result, baseline):
+    rate = metric_value(result, "per_second")
+    p50, p95, p99 = (metric_value(result, f"latency.p{p}_ms") for p in (50, 95, 99))
+    columns = [
+        f"{name:<26}",
+        f"{rate:>12,.0f}/s" if rate else f"{'':>14}",
+        f"{p50:>9.2f} {p95:>9.2f} {p99:>9.2f}" if p95 is not None else f"{'':>29}",
+        f"{(result.get('peak_rss_kb') or 0) / 1024:>8.0f} MiB",
+    ]
+    old_rate = metric_value(baseline.get(name, {}), "per_second")
+    old_p95 = metric_value(baseline.get(name, {}), "latency.p95_ms")
+    if rate and old_rate:
+        columns.append(f"{rate / old_rate - 1:+7.0%} rate")
+    elif p95 and old_p95:
+        columns.append(f"{p95 / old_p95 - 1:+7.0%} p95")
+    return " ".join(columns)
+
+
+def parse_sizes(scale, overrides):
+    sizes = dict(SCALES[scale])
+    for override in overrides or ():
+        name, sep, value = override.partition("=")
+        if not sep or name not in sizes:
+            raise ValueError(f"--size takes NAME=COUNT with NAME one of {', '.join(sizes)}, not {override!r}")
+        sizes[name] = int(value)
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the expense, asset, music and QR code tools on "
+                                                 "generated data and compare against a stored baseline.")
+    parser.add_argument("benchmarks", nargs="*", metavar="NAME",
+                        help="benchmarks to run, or prefixes such as 'assets' (default: all)")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="size of the generated data sets")
+    parser.add_argument("--size", action="append", metavar="NAME=COUNT",
+                        help=f"override one data set's size ({', '.join(SCALES['small'])})")
+    parser.add_argument("--data-dir", help=f"where generated data is kept (default {DEFAULT_DATA_DIR}/SCALE)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline for its scale")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"fractional slowdown tolerated before failing (default {TOLERANCE})")
+    parser.add_argument("--report", metavar="JSON", help="also write the full results to this file")
+    parser.add_argument("--prepare-only", action="store_true", help="generate the data sets and stop")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and stop")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    try:
+        sizes = parse_sizes(args.scale, args.size)
+    except ValueError as e:
+        parser.error(str(e))
+    names = [name for name in BENCHMARKS
+             if not args.benchmarks or any(name == b or name.startswith(b + ".") for b in args.benchmarks)]
+    if not names:
+        parser.error(f"no benchmark matches {' '.join(args.benchmarks)}; see --list")
+
+    data_dir = args.data_dir or os.path.join(DEFAULT_DATA_DIR, args.scale)
+    prepare(data_dir, sizes, datasets={BENCHMARKS[name][0] for name in names} & set(DATASETS))
+    if args.prepare_only:
+        return 0
+
+    baseline = read_baselines(args.baseline).get(args.scale, {}).get("results", {})
+    print(f"{'benchmark':<26} {'throughput':>14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS':>12}")
+    results = {}
+    for name in names:
+        results[name] = run_isolated(name, data_dir, sizes)
+        print(format_result(name, results[name], baseline), flush=True)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "scale": args.scale,
+        "sizes": sizes,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processors": os.cpu_count()},
+        "results": results,
+        "regressions": compare(results, baseline, args.tolerance),
+    }
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        save_baseline(args.baseline, args.scale, report)
+        print(f"Saved as the {args.scale} baseline in {args.baseline}")
+
+    for regression in report["regressions"]:
+        print(f"REGRESSION {regression['benchmark']} {regression['metric']}: {regression['baseline']} -> "
+              f"{regression['value']} ({regression['change']:+.0%})", file=sys.stderr)
+    if not baseline and not args.save_baseline:
+        print(f"No {args.scale} baseline in {args.baseline} to compare against; --save-baseline stores one.")
+    return 1 if report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,75 @@
-from Expenses import Expenses
+from Expenses import Expenses, ExpenseBatch
+from ExpenseLedger import ExpenseLedger, current_month
+from Instrumentation import timed
+import argparse
 import calendar
 import datetime
 import os
-import langflow
-from langflow import workflow
+import sys
 
 
 budget_file = "budget.txt"
+legacy_expense_file_path = "expenses.csv"
+# Cold start budget for a --summary-only run, checked by --check-startup.
+startup_budget_ms = 300
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track expenses against a monthly budget.")
+    parser.add_argument("--summary-only", action="store_true",
+                        help="print this month's summary without asking for any input")
+    parser.add_argument("--rescan", action="store_true",
+                        help="recount this month's partition instead of trusting the index")
+    parser.add_argument("--history", action="store_true",
+                        help="print totals for every month on record instead of this month's budget")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used by --rescan to recount partitions in parallel")
+    parser.add_argument("--import", dest="import_file", metavar="CSV",
+                        help="import a bank statement export instead of asking for expenses")
+    parser.add_argument("--rules", metavar="JSON",
+                        help="column and category rules for --import (see ExpenseImport.ImportRules)")
+    parser.add_argument("--batch-size", type=int, help="expenses written per batch by --import")
+    parser.add_argument("--no-migrate", action="store_true",
+                        help="leave an old expenses.csv where it is instead of moving it into the ledger")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report the slowest imports of a --summary-only run")
+    parser.add_argument("--check-startup", type=float, nargs="?", const=startup_budget_ms, metavar="MS",
+                        help=f"fail if a cold --summary-only run takes longer than MS (default {startup_budget_ms})")
+    args = parser.parse_args(argv)
+
+    if args.profile_startup:
+        sys.exit(0 if profile_startup() else 1)
+    if args.check_startup is not None:
+        sys.exit(0 if check_startup(args.check_startup) else 1)
 
-def main():
     print(f"Running Expense Tracker")
-    expense_file_path = "expenses.csv"
+    expense_ledger_dir = "expenses"
+    if not args.no_migrate:
+        migrate_legacy_expenses(expense_ledger_dir)
+
+    if args.import_file:
+        from ExpenseImport import ImportRules, import_statement
+
+        try:
+            rules = ImportRules.from_file(args.rules) if args.rules else ImportRules()
+        except (OSError, ValueError) as e:
+            print(f"Error: could not read the rules: {e}", file=sys.stderr)
+            return 1
+        imported, skipped = import_statement(args.import_file, ExpenseLedger(expense_ledger_dir), rules,
+                                             batch_size=args.batch_size)
+        print(f"Imported {imported} expenses from {args.import_file}, skipped {skipped} rows.")
+        return
+
+    if args.history:
+        summarise_history(expense_ledger_dir, rescan=args.rescan, workers=args.workers)
+        return
+
+    if args.summary_only:
+        budget = read_budget(interactive=False)
+        if budget is None:
+            print("No budget found. Run without --summary-only to set one up.")
+            return
+        summarise_expenses(expense_ledger_dir, budget, rescan=args.rescan, workers=args.workers)
+        return
 
     budget = read_budget()
     print(f"Your budget for the month is £{budget:.2f}")
@@ -27,14 +86,21 @@ def main():
             break
 
         # Save expense to a file
-        save_expense_to_a_file(expense, expense_file_path)
+        save_expense_to_a_file(expense, expense_ledger_dir)
 
         # Ask if the user wants to add more expenses
         if input("Do you want to add another expense? (y/n): ").strip().lower() != "y":
             break
 
     # Read expenses from a file and summarize
-    summarise_expenses(expense_file_path, budget)
+    summarise_expenses(expense_ledger_dir, budget, rescan=args.rescan, workers=args.workers)
+
+
+def migrate_legacy_expenses(expense_ledger_dir):
+    """Move an old flat expenses.csv into month partitions, once."""
+    if os.path.isfile(legacy_expense_file_path):
+        count = ExpenseLedger(expense_ledger_dir).migrate_flat_file(legacy_expense_file_path)
+        print(f"Migrated {count} expenses from {legacy_expense_file_path} to {expense_ledger_dir}")
 
 
 def set_budget():
@@ -47,9 +113,15 @@ def set_budget():
             print("Invalid input. Please enter a numeric value.")
 
 
-def read_budget():
-    """Read budget from file."""
+def read_budget(interactive=True):
+    """Read budget from file.
+
+    Without `interactive` a missing or broken budget returns None instead of
+    prompting for a new one.
+    """
     if not os.path.exists(budget_file):
+        if not interactive:
+            return None
         print("No budget found. Let's set one up.")
         budget = set_budget()
         write_budget(budget)
@@ -59,6 +131,8 @@ def read_budget():
         with open(budget_file, "r") as f:
             return float(f.read().strip())
     except (ValueError, FileNotFoundError):
+        if not interactive:
+            return None
         print("Invalid budget data found. Resetting the budget.")
         budget = set_budget()
         write_budget(budget)
@@ -116,44 +190,35 @@ def get_user_expense():
     )
 
 
-def save_expense_to_a_file(expense: Expenses, expense_file_path):
-    """Save an expense to a file."""
-    print(f"Saving expense to file: {expense} to {expense_file_path}")
-    with open(expense_file_path, "a", encoding="utf-8") as f:
-        f.write(f"{expense.name}, {expense.amount}, {expense.category}\n")
+def save_expense_to_a_file(expense: Expenses, expense_ledger_dir):
+    """Save an expense to its month partition."""
+    print(f"Saving expense to file: {expense} to {expense_ledger_dir}")
+    ExpenseLedger(expense_ledger_dir).append(expense)
 
 
-def summarise_expenses(expense_file_path, budget):
-    """Summarize expenses and display budget details."""
-    print(f"Summarizing expenses from {expense_file_path}")
-    expenses = []
-    try:
-        with open(expense_file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            for line in lines:
-                expense_name, expense_amount, expense_category = line.strip().split(",")
-                expenses.append(Expenses(
-                    name=expense_name,
-                    amount=float(expense_amount),
-                    category=expense_category
-                ))
-    except FileNotFoundError:
-        print("No expenses recorded yet.")
-        return
-
+@timed
+def summarise_expenses(expenses, budget, rescan=False, workers=1):
+    """Summarize this month's expenses and display budget details.
 
-    amount_per_category = {}
-    for expense in expenses:
-        if expense.category in amount_per_category:
-            amount_per_category[expense.category] += expense.amount
-        else:
-            amount_per_category[expense.category] = expense.amount
+    `expenses` is either a ledger directory or an ExpenseBatch already in memory.
+    """
+    if isinstance(expenses, ExpenseBatch):
+        category_totals = expenses.category_totals()
+    else:
+        print(f"Summarizing expenses from {expenses}")
+        month = current_month()
+        ledger = ExpenseLedger(expenses)
+        found = ledger.rebuild(month, workers) if rescan else ledger.refresh(month)
+        if not found:
+            print("No expenses recorded yet.")
+            return
+        category_totals = ledger.category_totals(month)
 
     print("Summary of expenses:")
-    for category, amount in amount_per_category.items():
-        print(f"{category}: £{amount:.2f}")
+    for category, pence in category_totals.items():
+        print(f"{category}: £{pence / 100:.2f}")
 
-    total_spent = sum(expense.amount for expense in expenses)
+    total_spent = sum(category_totals.values()) / 100
     remaining_budget = budget - total_spent
     print(f"Total spent: £{total_spent:.2f}")
     print(f"Remaining budget: £{remaining_budget:.2f}")
@@ -171,6 +236,94 @@ def summarise_expenses(expense_file_path, budget):
     print(f"Daily budget: £{daily_budget:.2f}")
 
 
+@timed
+def summarise_history(expense_ledger_dir, rescan=False, workers=1):
+    """Summarize every month on record, per category and per month."""
+    print(f"Summarizing all expenses from {expense_ledger_dir}")
+    ledger = ExpenseLedger(expense_ledger_dir)
+    found = ledger.rebuild(workers=workers) if rescan else ledger.refresh()
+    if not found:
+        print("No expenses recorded yet.")
+        return
+
+    print("Summary of expenses:")
+    for category, pence in ledger.category_totals().items():
+        print(f"{category}: £{pence / 100:.2f}")
+
+    print("Spent per month:")
+    for month in sorted(ledger.months):
+        print(f"{month}: £{ledger.total(month) / 100:.2f}")
+    print(f"Total spent: £{ledger.total() / 100:.2f}")
+
+
+def startup_command(*options):
+    """A --summary-only run that only reads the ledger, so measuring it never migrates expenses.csv."""
+    return [sys.executable, *options, os.path.abspath(__file__), "--summary-only", "--no-migrate"]
+
+
+def report_failed_run(result, stderr_lines):
+    print(red(f"The --summary-only run failed with exit code {result.returncode}."))
+    for line in stderr_lines[-10:]:
+        print(line)
+
+
+def profile_startup(top=15):
+    """Run a --summary-only start in a fresh interpreter and list its costliest imports.
+
+    Returns False if the run itself failed.
+    """
+    import subprocess
+
+    result = subprocess.run(startup_command("-X", "importtime"), capture_output=True, text=True)
+    imports = []
+    errors = []
+    for line in result.stderr.splitlines():
+        # Lines look like "import time:  self [us] | cumulative | imported package".
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            imports.append((int(cumulative_us), int(self_us), name.rstrip()))
+        except ValueError:
+            continue
+
+    total_us = sum(self_us for _, self_us, _ in imports)
+    print(f"{len(imports)} modules imported in {total_us / 1000:.1f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative_us, self_us, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+    if result.returncode:
+        report_failed_run(result, errors)
+        return False
+    return True
+
+
+def check_startup(budget_ms, runs=3):
+    """Time cold --summary-only runs and report whether the median fits the budget.
+
+    A run that exits with an error fails the check.
+    """
+    import statistics
+    import subprocess
+    import time
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(startup_command(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode:
+            report_failed_run(result, result.stderr.splitlines())
+            return False
+        timings.append((time.perf_counter() - start) * 1000)
+    median_ms = statistics.median(timings)
+    if median_ms > budget_ms:
+        print(red(f"Cold start took {median_ms:.0f} ms, over the {budget_ms:.0f} ms budget."))
+        return False
+    print(green(f"Cold start took {median_ms:.0f} ms, within the {budget_ms:.0f} ms budget."))
+    return True
+
+
 def green(text):
     return f"\033[92m{text}\033[00m"
 
@@ -180,4 +333,4 @@ def red(text):
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
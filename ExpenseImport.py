@@ -0,0 +1,119 @@
+import csv
+import datetime
+import json
+import math
+import re
+
+from Expenses import Expenses
+
+DEFAULT_CATEGORY = "Miscellaneous 🛒"
+# Partitions are read a line at a time, so text from a statement must not break a line
+LINE_BREAKS = re.compile(r"[\r\n]+")
+RULE_KEYS = ("columns", "date_format", "categories", "category_map", "default_category", "negate_amounts",
+             "delimiter")
+
+
+class ImportRules:
+    """How to turn the rows of a bank statement export into expenses.
+
+    A rules file is JSON, for example:
+
+        {
+            "columns": {"date": "Date", "name": "Description", "amount": "Amount"},
+            "date_format": "%d/%m/%Y",
+            "negate_amounts": true,
+            "categories": [
+                {"match": "TESCO|SAINSBURY", "category": "Food 🍔"},
+                {"match": "TFL|TRAINLINE", "category": "Transport 🚗"}
+            ],
+            "default_category": "Miscellaneous 🛒"
+        }
+
+    `columns` maps our fields to the export's headers; a `category` column is
+    optional and its values can be renamed with `category_map`. Otherwise the
+    first `categories` pattern matching the name wins. Rows whose amount is
+    not positive (after `negate_amounts`) are skipped as credits.
+    """
+
+    def __init__(self, columns=None, date_format="%Y-%m-%d", categories=(), category_map=None,
+                 default_category=DEFAULT_CATEGORY, negate_amounts=False, delimiter=","):
+        self.columns = {"date": "date", "name": "name", "amount": "amount", **(columns or {})}
+        self.date_format = date_format
+        self.category_rules = [(re.compile(rule["match"], re.IGNORECASE), rule["category"]) for rule in categories]
+        self.category_map = category_map or {}
+        self.default_category = default_category
+        self.negate_amounts = negate_amounts
+        self.delimiter = delimiter
+
+    @classmethod
+    def from_file(cls, rules_file_path):
+        """Load rules from a JSON file. Raises ValueError if the file is not valid rules."""
+        with open(rules_file_path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+        if not isinstance(rules, dict):
+            raise ValueError(f"{rules_file_path} must hold a JSON object")
+        unknown = [key for key in rules if key not in RULE_KEYS]
+        if unknown:
+            raise ValueError(f"{rules_file_path} has unknown keys {', '.join(map(repr, unknown))}; "
+                             f"expected any of {', '.join(RULE_KEYS)}")
+        try:
+            return cls(**rules)
+        except KeyError as e:
+            raise ValueError(f"{rules_file_path} has a category rule without {e}") from None
+        except (TypeError, re.error) as e:
+            raise ValueError(f"{rules_file_path} has bad rules: {e}") from None
+
+    def category_for(self, name, raw_category=None):
+        if raw_category:
+            return self.category_map.get(raw_category, raw_category)
+        for pattern, category in self.category_rules:
+            if pattern.search(name):
+                return category
+        return self.default_category
+
+    def to_expense(self, row):
+        """Build an Expenses from one export row, or None if it should be skipped."""
+        columns = self.columns
+        missing = [header for header in columns.values() if row.get(header) is None]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        amount = float(row[columns["amount"]].replace(",", "").replace("£", "").strip())
+        if not math.isfinite(amount):
+            raise ValueError(f"amount is {amount}")
+        if self.negate_amounts:
+            amount = -amount
+        if amount <= 0:
+            return None
+        name = LINE_BREAKS.sub(" ", row[columns["name"]]).strip()
+        raw_category = LINE_BREAKS.sub(" ", row[columns["category"]]).strip() if "category" in columns else None
+        return Expenses(
+            name=name,
+            amount=amount,
+            category=self.category_for(name, raw_category),
+            date=datetime.datetime.strptime(row[columns["date"]].strip(), self.date_format).date()
+        )
+
+
+def read_statement(statement_file_path, rules, skipped):
+    """Stream the expenses in a statement export, counting skipped rows in `skipped`."""
+    with open(statement_file_path, "r", encoding="utf-8-sig", newline="") as f:
+        for line_number, row in enumerate(csv.DictReader(f, delimiter=rules.delimiter), start=2):
+            try:
+                expense = rules.to_expense(row)
+            except ValueError as e:
+                print(f"Skipping line {line_number}: {e}")
+                expense = None
+            if expense is None:
+                skipped[0] += 1
+            else:
+                yield expense
+
+
+def import_statement(statement_file_path, ledger, rules, batch_size=None):
+    """Import a statement export into a ledger. Returns (imported, skipped)."""
+    skipped = [0]
+    expenses = read_statement(statement_file_path, rules, skipped)
+    options = {"batch_size": batch_size} if batch_size else {}
+    imported = ledger.append_many(expenses, progress=lambda count: print(f"Imported {count} expenses..."),
+                                  **options)
+    return imported, skipped[0]
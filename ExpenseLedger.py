@@ -0,0 +1,422 @@
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+
+from Expenses import ExpenseBatch
+from Instrumentation import timed
+
+PARTITION_PATTERN = re.compile(r"^(\d{4}-\d{2})\.csv$")
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 10000
+
+
+def to_pence(amount):
+    """Convert a pound amount to whole pence."""
+    return round(float(amount) * 100)
+
+
+def iter_line_chunks(file_path, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """Yield the complete lines in a byte range of a file, a chunk at a time.
+
+    The range is read in fixed-size chunks cut at line boundaries, so memory
+    stays flat however large the file is. Each item is the decoded text of
+    the chunk and the offset just past its last line; a half written last
+    line is never yielded.
+    """
+    offset = start
+    pending = b""
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+
+            data = pending + chunk
+            cut = data.rfind(b"\n") + 1
+            pending = data[cut:]
+            if cut:
+                offset += cut
+                yield data[:cut].decode("utf-8"), offset
+
+
+def read_rows(text):
+    """Parse partition lines into (date, name, pence, category) tuples."""
+    for row in csv.reader(io.StringIO(text), skipinitialspace=True):
+        if not row:
+            continue
+        try:
+            # Older lines were not quoted, so extra fields belong to the name.
+            yield row[0], ",".join(row[1:-2]), to_pence(row[-2]), row[-1].strip()
+        except (IndexError, ValueError):
+            print(f"Skipping unreadable expense line: {row!r}")
+
+
+def stream_category_totals(file_path, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """Total pence per category for the lines in a byte range of a partition.
+
+    Each chunk is parsed with the csv module and summed per category code
+    with numpy. Returns the totals and the offset just past the last complete
+    line, leaving any half written last line for the next call.
+    """
+    # Imported here so summaries served from the index never pay for numpy.
+    import numpy as np
+
+    codes = {}
+    totals = np.zeros(0, dtype=np.int64)
+    offset = start
+    for text, offset in iter_line_chunks(file_path, start, end, chunk_size):
+        chunk_codes = []
+        chunk_pence = []
+        for _, _, pence, category in read_rows(text):
+            code = codes.get(category)
+            if code is None:
+                code = codes[category] = len(codes)
+            chunk_codes.append(code)
+            chunk_pence.append(pence)
+
+        if chunk_codes:
+            # Per-chunk sums stay far below 2**53, so the float weights are exact.
+            sums = np.bincount(chunk_codes, weights=chunk_pence, minlength=len(codes))
+            totals = np.pad(totals, (0, len(codes) - len(totals)))
+            totals += np.rint(sums).astype(np.int64)
+
+    return {category: int(totals[code]) for category, code in codes.items()}, offset
+
+
+def shard_ranges(file_path, shard_size):
+    """Split a file into byte ranges of about `shard_size` that start on line boundaries."""
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, "rb") as f:
+        start = 0
+        while start < size:
+            end = start + shard_size
+            if end >= size:
+                end = size
+            else:
+                # Move the cut to just after the line it landed in.
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _shard_totals(shard):
+    file_path, start, end = shard
+    return stream_category_totals(file_path, start, end)
+
+
+@timed
+def parallel_category_totals(file_paths, workers=None):
+    """Total pence per category for whole files, parsed by a pool of processes.
+
+    Every file is cut into line-aligned shards, a few per worker, which are
+    summed independently and merged back in file order. Amounts are whole
+    pence and categories keep their first-seen order, so the result is
+    identical to running stream_category_totals over each file in turn.
+    Returns one (totals, end offset) pair per file.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    total_size = sum(os.path.getsize(file_path) for file_path in file_paths)
+    shard_size = max(CHUNK_SIZE, total_size // (workers * 4) + 1)
+    shards = [(file_path, start, end) for file_path in file_paths
+              for start, end in shard_ranges(file_path, shard_size)]
+
+    results = {file_path: ({}, 0) for file_path in file_paths}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (file_path, _, _), (shard_totals, offset) in zip(shards, pool.map(_shard_totals, shards)):
+            totals, _ = results[file_path]
+            for category, pence in shard_totals.items():
+                totals[category] = totals.get(category, 0) + pence
+            results[file_path] = (totals, offset)
+    return [results[file_path] for file_path in file_paths]
+
+
+def read_expense_batch(file_path, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """Load the lines in a byte range of a partition into an ExpenseBatch."""
+    batch = ExpenseBatch()
+    for text, _ in iter_line_chunks(file_path, start, end, chunk_size):
+        for expense_date, expense_name, pence, category in read_rows(text):
+            try:
+                day = datetime.date.fromisoformat(expense_date)
+            except ValueError:
+                print(f"Skipping expense with an unreadable date: {expense_date!r}")
+                continue
+            batch.append(expense_name, pence, category, day)
+    return batch
+
+
+def current_month():
+    return datetime.date.today().strftime("%Y-%m")
+
+
+class ExpenseLedger:
+    """Expenses stored in one CSV partition per month, with a small JSON index.
+
+    For every month the index records the partition file, the byte range of it
+    that has been counted and the running totals per category. A summary of
+    one month therefore only reads lines appended to that partition since the
+    last run, and never touches the other months.
+    """
+
+    def __init__(self, ledger_dir):
+        self.ledger_dir = ledger_dir
+        self.index_file_path = os.path.join(ledger_dir, "index.json")
+        self.months = {}
+        self._load()
+
+    def _load(self):
+        """Read the index, starting from an empty one if it is missing or broken."""
+        try:
+            with open(self.index_file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.months = {month: self._check_entry(entry) for month, entry in data["months"].items()}
+        except (FileNotFoundError, ValueError, KeyError, TypeError, AttributeError):
+            self.months = {}
+
+    @staticmethod
+    def _check_entry(entry):
+        return {
+            "file": str(entry["file"]),
+            "start": int(entry["start"]),
+            "end": int(entry["end"]),
+            "head": str(entry["head"]),
+            "categories": {k: int(v) for k, v in entry["categories"].items()},
+        }
+
+    def _save(self):
+        """Write the index atomically so a crash never leaves it half written."""
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        temp_path = self.index_file_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"months": self.months}, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_file_path)
+
+    @staticmethod
+    def _new_entry(month):
+        return {"file": f"{month}.csv", "start": 0, "end": 0, "head": "", "categories": {}}
+
+    @staticmethod
+    def _head_digest(f):
+        """Fingerprint the first line of a partition to notice when it has been replaced."""
+        f.seek(0)
+        first_line = f.read(4096).split(b"\n", 1)[0]
+        return hashlib.sha1(first_line).hexdigest()
+
+    def partition_path(self, month):
+        return os.path.join(self.ledger_dir, f"{month}.csv")
+
+    def partitions(self):
+        """Months that have a partition on disk, oldest first."""
+        try:
+            names = os.listdir(self.ledger_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(match.group(1) for match in map(PARTITION_PATTERN.match, names) if match)
+
+    def _refresh(self, month):
+        """Replay the unseen tail of one partition into its index entry.
+
+        Returns True if the index entry changed.
+        """
+        try:
+            f = open(self.partition_path(month), "rb")
+        except FileNotFoundError:
+            return self.months.pop(month, None) is not None
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            entry = self.months.get(month)
+            if entry is not None and entry["end"] == size and size:
+                return False
+            head = self._head_digest(f) if size else ""
+
+        if entry is None or size < entry["end"] or (entry["end"] and head != entry["head"]):
+            # New, shrunk or swapped partition: count it from the start.
+            entry = self._new_entry(month)
+        entry["head"] = head
+
+        tail_totals, entry["end"] = stream_category_totals(self.partition_path(month), entry["end"], size)
+        categories = entry["categories"]
+        for category, pence in tail_totals.items():
+            categories[category] = categories.get(category, 0) + pence
+        self.months[month] = entry
+        return True
+
+    @timed
+    def refresh(self, month=None):
+        """Bring the index up to date for one month, or for every partition.
+
+        Returns True if there is any data for the requested month(s).
+        """
+        if month:
+            months = [month]
+        else:
+            months = sorted(set(self.partitions()) | set(self.months))
+        changed = False
+        for m in months:
+            changed |= self._refresh(m)
+        if changed:
+            self._save()
+        return any(m in self.months for m in months)
+
+    @timed
+    def rebuild(self, month=None, workers=1):
+        """Forget the cached totals and recount one month, or every partition.
+
+        With more than one worker the partitions are split into shards and
+        counted in parallel; the totals come out exactly the same.
+        """
+        months = [month] if month else self.partitions()
+        for m in months:
+            self.months.pop(m, None)
+
+        if workers > 1:
+            months_on_disk = [m for m in months if os.path.exists(self.partition_path(m))]
+            paths = [self.partition_path(m) for m in months_on_disk]
+            for m, path, (totals, end) in zip(months_on_disk, paths, parallel_category_totals(paths, workers)):
+                entry = self._new_entry(m)
+                with open(path, "rb") as f:
+                    entry["head"] = self._head_digest(f)
+                entry["categories"] = totals
+                entry["end"] = end
+                self.months[m] = entry
+
+        # Counts everything serially, or just picks up writes made during the parallel pass.
+        for m in months:
+            self._refresh(m)
+        self._save()
+        return any(m in self.months for m in months)
+
+    @timed
+    def load_batch(self, month):
+        """Read a whole month partition into an ExpenseBatch."""
+        try:
+            return read_expense_batch(self.partition_path(month))
+        except FileNotFoundError:
+            return ExpenseBatch()
+
+    def _write_month(self, month, expenses, sync=False):
+        """Append expenses of one month in a single write and fold them into the totals."""
+        self._refresh(month)
+        entry = self.months.setdefault(month, self._new_entry(month))
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        categories = entry["categories"]
+        for expense in expenses:
+            writer.writerow([expense.date.isoformat(), expense.name, expense.amount, expense.category])
+            categories[expense.category] = categories.get(expense.category, 0) + to_pence(expense.amount)
+
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        with open(self.partition_path(month), "ab") as f:
+            f.write(buffer.getvalue().encode("utf-8"))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+            entry["end"] = f.tell()
+        if not entry["head"]:
+            with open(self.partition_path(month), "rb") as f:
+                entry["head"] = self._head_digest(f)
+
+    def append(self, expense):
+        """Append an expense to its month partition and fold it into the totals."""
+        self._write_month(expense.date.strftime("%Y-%m"), [expense])
+        self._save()
+
+    @timed
+    def append_many(self, expenses, batch_size=BATCH_SIZE, progress=None):
+        """Append an iterable of expenses in large batches.
+
+        Each batch is grouped by month and written with one buffered append
+        and one fsync per partition, then the index is saved once. If the
+        process dies between the two, the next refresh replays the tail.
+        `progress` is called with the running count after every batch.
+        """
+        count = 0
+        batch = []
+        for expense in expenses:
+            batch.append(expense)
+            if len(batch) >= batch_size:
+                count += self._write_batch(batch)
+                batch = []
+                if progress:
+                    progress(count)
+        if batch:
+            count += self._write_batch(batch)
+            if progress:
+                progress(count)
+        return count
+
+    def _write_batch(self, expenses):
+        by_month = {}
+        for expense in expenses:
+            by_month.setdefault(expense.date.strftime("%Y-%m"), []).append(expense)
+        for month, month_expenses in by_month.items():
+            self._write_month(month, month_expenses, sync=True)
+        self._save()
+        return len(expenses)
+
+    def category_totals(self, month=None):
+        """Totals per category in pence, for one month or across all of them."""
+        if month:
+            return dict(self.months.get(month, {}).get("categories", {}))
+        totals = {}
+        for entry in self.months.values():
+            for category, pence in entry["categories"].items():
+                totals[category] = totals.get(category, 0) + pence
+        return totals
+
+    def total(self, month=None):
+        """Total spent in pence, for one month or across all of them."""
+        return sum(self.category_totals(month).values())
+
+    def migrate_flat_file(self, flat_file_path):
+        """Move a legacy `name, amount, category` CSV into month partitions.
+
+        The old format has no dates, so every row is filed under the day the
+        flat file was last modified. The flat file is renamed to
+        `<name>.migrated` afterwards so the migration only ever runs once.
+        """
+        migrated_date = datetime.date.fromtimestamp(os.path.getmtime(flat_file_path)).isoformat()
+        month = migrated_date[:7]
+        self._refresh(month)
+        os.makedirs(self.ledger_dir, exist_ok=True)
+
+        count = 0
+        with open(flat_file_path, "r", encoding="utf-8") as src, \
+                open(self.partition_path(month), "a", encoding="utf-8", newline="") as dst:
+            writer = csv.writer(dst, lineterminator="\n")
+            for line in src:
+                if not line.strip():
+                    continue
+                try:
+                    # The old format is unquoted, so split from the right to keep commas in names.
+                    expense_name, expense_amount, expense_category = line.strip().rsplit(",", 2)
+                    float(expense_amount)
+                except ValueError:
+                    print(f"Skipping unreadable expense line: {line!r}")
+                    continue
+                writer.writerow([migrated_date, expense_name.strip(), expense_amount.strip(),
+                                 expense_category.strip()])
+                count += 1
+
+        self._refresh(month)
+        self._save()
+        os.replace(flat_file_path, flat_file_path + ".migrated")
+        sidecar_path = flat_file_path + ".summary.json"
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+        return count
@@ -1,9 +1,91 @@
+from array import array
+import datetime
+
+
 class Expenses:
+    __slots__ = ("name", "category", "amount", "date")
     
-    def __init__(self, name, category, amount) -> None:
+    def __init__(self, name, category, amount, date=None) -> None:
         self.name = name
         self.category = category
         self.amount = amount
+        self.date = date or datetime.date.today()
         
     def __repr__(self):
-        return f"<Expense: {self.name},  {self.category},  £{self.amount:.2f}>"
\ No newline at end of file
+        return f"<Expense: {self.name},  {self.category},  £{self.amount:.2f}>"
+
+
+class ExpenseBatch:
+    """Many expenses stored column by column instead of one object per row.
+
+    Amounts are whole pence, categories are interned to small integer ids,
+    dates are day ordinals and names live in one UTF-8 pool indexed by
+    offsets. Expenses objects are only built when a row is asked for.
+    """
+
+    def __init__(self):
+        self.pence = array("q")
+        self.category_ids = array("I")
+        self.days = array("i")
+        self.name_offsets = array("Q", [0])
+        self.name_pool = bytearray()
+        self.categories = []
+        self._category_ids = {}
+
+    def __len__(self):
+        return len(self.pence)
+
+    def category_id(self, category):
+        """Intern a category name, returning its id."""
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            category_id = self._category_ids[category] = len(self.categories)
+            self.categories.append(category)
+        return category_id
+
+    def append(self, name, pence, category, date):
+        """Add one row from its raw parts."""
+        self.name_pool += name.encode("utf-8")
+        self.name_offsets.append(len(self.name_pool))
+        self.pence.append(pence)
+        self.category_ids.append(self.category_id(category))
+        self.days.append(date.toordinal())
+
+    def add(self, expense):
+        """Add one row from an Expenses object."""
+        self.append(expense.name, round(expense.amount * 100), expense.category, expense.date)
+
+    def name(self, index):
+        return self.name_pool[self.name_offsets[index]:self.name_offsets[index + 1]].decode("utf-8")
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("expense batch index out of range")
+        return Expenses(
+            name=self.name(index),
+            category=self.categories[self.category_ids[index]],
+            amount=self.pence[index] / 100,
+            date=datetime.date.fromordinal(self.days[index]),
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def category_totals(self):
+        """Total pence per category, summed over the columns without building rows."""
+        if not self.pence:
+            return {}
+        import numpy as np
+
+        ids = np.frombuffer(self.category_ids, dtype=np.uint32)
+        pence = np.frombuffer(self.pence, dtype=np.int64)
+        totals = np.zeros(len(self.categories), dtype=np.int64)
+        np.add.at(totals, ids, pence)
+        return {category: int(totals[i]) for i, category in enumerate(self.categories)}
+
+    def total(self):
+        """Total of every row, in pence."""
+        return sum(self.pence)
\ No newline at end of file
@@ -0,0 +1,231 @@
+import atexit
+import functools
+import math
+import os
+import sys
+import threading
+import time
+
+# Set this to a file path to turn instrumentation on; the report is written there at exit
+REPORT_ENV = "INSTRUMENT_REPORT"
+# Worker processes inherit the environment, so only the process that started it writes the report
+OWNER_ENV = "INSTRUMENT_REPORT_PID"
+MAX_SAMPLES = 100000  # Per timer; past this a uniform random sample is kept for the percentiles
+PERCENTILES = (50, 90, 95, 99)
+HEARTBEAT_MS = 100
+
+report_path = os.environ.get(REPORT_ENV) or None
+timers = {}
+_lock = threading.Lock()
+_started = time.time()
+_tk_patched = False
+
+
+def enabled():
+    return report_path is not None
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted list."""
+    return ordered[max(1, math.ceil(percent / 100 * len(ordered))) - 1]
+
+
+def latency_summary(seconds):
+    """Count, mean, maximum and percentiles (in milliseconds) of a list of durations in seconds."""
+    ordered = sorted(seconds)
+    if not ordered:
+        return {"count": 0}
+    summary = {
+        "count": len(ordered),
+        "total_ms": round(sum(ordered) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+    for percent in PERCENTILES:
+        summary[f"p{percent}_ms"] = round(percentile(ordered, percent) * 1000, 3)
+    return summary
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, or None where it can't be read."""
+    try:
+        # Linux's ru_maxrss can carry over the peak of the process that forked this one
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_kb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _windows_peak_rss_kb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize // 1024
+    except (AttributeError, OSError):
+        return None
+
+
+class Timer:
+    """Running count, total and maximum of one timed operation, and a bounded sample of its durations."""
+
+    __slots__ = ("count", "total", "longest", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            import random
+
+            slot = random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = seconds
+
+    def summary(self):
+        summary = latency_summary(self.samples)
+        # The sample only feeds the percentiles once it is full; these stay exact
+        summary.update(count=self.count, total_ms=round(self.total * 1000, 3),
+                       mean_ms=round(self.total / self.count * 1000, 3), max_ms=round(self.longest * 1000, 3))
+        return summary
+
+
+def record(name, seconds):
+    with _lock:
+        timer = timers.get(name)
+        if timer is None:
+            timer = timers[name] = Timer()
+        timer.add(seconds)
+
+
+def timed(name=None):
+    """Decorator that times every call when instrumentation is on, and returns the function untouched otherwise.
+
+    Use it bare (@timed) to name the timer after the function, or as
+    @timed("name"). Calls made in worker processes are not reported.
+    """
+    def decorate(func):
+        if not enabled():
+            return func
+        module = func.__module__
+        # Functions of a script run directly have no useful module name
+        label = name or (func.__qualname__ if module in (None, "__main__") else f"{module}.{func.__qualname__}")
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - start)
+        return wrapper
+
+    if callable(name):
+        func, name = name, None
+        return decorate(func)
+    return decorate
+
+
+def _callback_name(func):
+    name = getattr(func, "__qualname__", None) or type(func).__name__
+    # after() runs everything through a local callit, renamed after the real callback
+    return func.__name__ if "after.<locals>" in name else name
+
+
+def instrument_tk(root, heartbeat_ms=HEARTBEAT_MS):
+    """Time every Tk callback, and how late the event loop gets round to a steady heartbeat.
+
+    Callback durations go to "tk.callback" and "tk.callback:<name>", the
+    heartbeat's lateness to "tk.event_loop_lag". Does nothing unless
+    instrumentation is on.
+    """
+    global _tk_patched
+    if not enabled():
+        return
+    import tkinter
+
+    if not _tk_patched:
+        call = tkinter.CallWrapper.__call__
+
+        def timed_call(self, *args):
+            start = time.perf_counter()
+            try:
+                return call(self, *args)
+            finally:
+                if getattr(self.func, "__name__", None) != "tk_heartbeat":
+                    elapsed = time.perf_counter() - start
+                    record("tk.callback", elapsed)
+                    record(f"tk.callback:{_callback_name(self.func)}", elapsed)
+
+        tkinter.CallWrapper.__call__ = timed_call
+        _tk_patched = True
+
+    interval = heartbeat_ms / 1000
+    due = [time.perf_counter() + interval]
+
+    def tk_heartbeat():
+        now = time.perf_counter()
+        record("tk.event_loop_lag", max(0.0, now - due[0]))
+        due[0] = now + interval
+        try:
+            root.after(heartbeat_ms, tk_heartbeat)
+        except tkinter.TclError:
+            pass  # The window has been destroyed
+
+    root.after(heartbeat_ms, tk_heartbeat)
+
+
+def report():
+    """Everything recorded so far, as a JSON-ready dict."""
+    with _lock:
+        timings = {name: timer.summary() for name, timer in sorted(timers.items())}
+    return {
+        "program": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "",
+        "pid": os.getpid(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+        "seconds": round(time.time() - _started, 3),
+        "peak_rss_kb": peak_rss_kb(),
+        "timings": timings,
+    }
+
+
+def write_report(path=None):
+    import json
+
+    path = path or report_path
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)
+    os.replace(temp_path, path)
+
+
+if enabled() and os.environ.setdefault(OWNER_ENV, str(os.getpid())) == str(os.getpid()):
+    atexit.register(write_report)
@@ -1,24 +1,65 @@
 import os
+import queue
+import random
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pygame import mixer
-import threading
-import time
+from AudioMetadata import DurationCache
+from Instrumentation import instrument_tk, timed
+from MusicLibrary import MusicLibrary, track_label
+from Playlist import PLAYLIST_FILE_TYPES, Playlist
+from Waveform import WAVEFORM_BINS, PeakCache, cached_peaks
 
-# Initialize the mixer
-mixer.init()
+REPEAT_MODES = ("off", "all", "one")
+PREFETCH_CHUNK = 1 << 20
+LOAD_BATCH = 500  # Playlist rows added per pass of the event loop
+LOAD_INTERVAL_MS = 20
+VISIBLE_ROWS = 15
+WAVEFORM_HEIGHT = 40
 
 class MusicPlayer:
-    def __init__(self, root):
+    def __init__(self, root, refresh_ms=500):
         self.root = root
         self.root.title("Music Player")
         self.root.geometry("600x400")
         self.root.config(bg="#1e1e2f")  # Dark background
         self.current_track = None
         self.is_playing = False
+        self.is_paused = False  # Only a paused track can be resumed
         self.track_length = 0
-        self.stop_thread = False
-        self.playlist = []
+        self.refresh_ms = refresh_ms  # How often the progress bar moves
+        self.seek_offset = 0.0  # get_pos() counts from play(), not from the last seek
+        self.progress_job = None
+        self.setting_progress = False
+        self.playlist = Playlist()
+        self.durations = DurationCache()
+        self.current_id = None  # Playlist entry ID of the current track
+        self.removed_at = {}  # Where the current or queued entry was when it was removed from the playlist
+        self.selected_id = None
+        self.top = 0  # Playlist position of the first row shown
+        self.shuffle = tk.BooleanVar(value=False)
+        self.repeat = "off"
+        self.order = []  # Shuffled entry IDs; unshuffled play follows the playlist itself
+        self.order_position = {}
+        # One worker for prefetching and slow decodes, however many tracks play
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.prefetch_job = None
+        self.queued_id = None
+        self.queued_track = None
+        self.queued_length = 0
+        self.last_pos_ms = 0
+        self.library = MusicLibrary()
+        self.pending_tracks = deque()  # Library tracks waiting to go into the playlist
+        self.scan_results = queue.Queue()  # Batches of tracks from the scanner thread
+        self.scan_thread = None
+        self.scan_counts = None
+        self.load_job = None
+        self.peaks = PeakCache()
+        self.waveform_pool = None  # A process, started the first time peaks need computing
+        self.waveform_job = None
 
         # Styles
         style = ttk.Style()
@@ -32,10 +73,23 @@ class MusicPlayer:
         playlist_frame = tk.Frame(root, bg="#2e2e3f", relief="sunken", bd=2)
         playlist_frame.pack(side="right", fill="y", padx=10, pady=10)
 
-        self.playlist_box = ttk.Treeview(playlist_frame, columns=("Track"), show="headings", height=15)
+        # The Treeview only ever holds the rows in view; item IDs are playlist entry IDs
+        playlist_buttons = tk.Frame(playlist_frame, bg="#2e2e3f")
+        playlist_buttons.pack(side="bottom", fill="x")
+        self.playlist_scrollbar = ttk.Scrollbar(playlist_frame, orient="vertical", command=self.scroll_playlist)
+        self.playlist_scrollbar.pack(side="right", fill="y")
+        self.playlist_box = ttk.Treeview(playlist_frame, columns=("Track"), show="headings", height=VISIBLE_ROWS,
+                                         selectmode="browse")
         self.playlist_box.heading("Track", text="Playlist")
         self.playlist_box.pack(fill="both", expand=True)
         self.playlist_box.bind("<Double-1>", self.select_track)
+        self.playlist_box.bind("<<TreeviewSelect>>", self.remember_selection)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.playlist_box.bind(sequence, self.wheel_playlist)
+
+        for text, command in (("📂", self.open_playlist), ("💾", self.save_playlist), ("⬆", self.move_up),
+                              ("⬇", self.move_down), ("➖", self.remove_selected)):
+            ttk.Button(playlist_buttons, text=text, width=3, command=command).pack(side="left", padx=2, pady=2)
 
         # Controls Frame
         controls_frame = tk.Frame(root, bg="#1e1e2f")
@@ -45,9 +99,15 @@ class MusicPlayer:
         self.label = ttk.Label(root, text="No Track Selected", anchor="center", wraplength=500)
         self.label.pack(pady=10)
 
+        # Waveform overview, one column per peak bin, drawn just above the progress bar
+        self.waveform = tk.Canvas(root, width=WAVEFORM_BINS, height=WAVEFORM_HEIGHT, bg="#1e1e2f",
+                                  highlightthickness=0)
+        self.waveform.pack()
+        self.waveform.bind("<Button-1>", self.seek_waveform)
+
         # Progress Bar
         self.progress = ttk.Scale(root, from_=0, to=100, orient="horizontal", length=500, command=self.seek_track)
-        self.progress.pack(pady=10)
+        self.progress.pack(pady=(0, 10))
 
         # Buttons
         self.play_button = ttk.Button(controls_frame, text="▶ Play", command=self.play_music)
@@ -65,6 +125,16 @@ class MusicPlayer:
         self.add_button = ttk.Button(controls_frame, text="➕ Add", command=self.add_to_playlist)
         self.add_button.pack(side="left", padx=5)
 
+        self.scan_button = ttk.Button(controls_frame, text="📁 Scan Folder", command=self.scan_folder)
+        self.scan_button.pack(side="left", padx=5)
+
+        self.shuffle_button = ttk.Checkbutton(controls_frame, text="🔀 Shuffle", variable=self.shuffle,
+                                              command=self.playlist_changed)
+        self.shuffle_button.pack(side="left", padx=5)
+
+        self.repeat_button = ttk.Button(controls_frame, text="🔁 Repeat: off", command=self.cycle_repeat)
+        self.repeat_button.pack(side="left", padx=5)
+
         # Volume Slider
         volume_frame = tk.Frame(root, bg="#1e1e2f")
         volume_frame.pack(pady=5)
@@ -74,63 +144,429 @@ class MusicPlayer:
         self.volume_slider.set(0.5)
         self.volume_slider.pack(side="left", padx=5)
 
+        self.status = ttk.Label(root, text="", font=("Arial", 9))
+        self.status.pack(pady=5)
+
+        # Start with everything found by earlier scans
+        self.pending_tracks.extend(self.library.tracks())
+        self.schedule_load()
+
     def add_to_playlist(self):
         file_paths = filedialog.askopenfilenames(filetypes=[("Audio Files", "*.mp3 *.wav *.ogg *.flac")])
         for file_path in file_paths:
-            self.playlist.append(file_path)
-            self.playlist_box.insert("", "end", values=(os.path.basename(file_path),))
+            self.playlist.add(file_path)
+        if file_paths:
+            self.playlist_changed()
+
+    def open_playlist(self):
+        file_path = filedialog.askopenfilename(filetypes=PLAYLIST_FILE_TYPES)
+        if not file_path:
+            return
+        try:
+            self.playlist.load(file_path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not open {file_path}: {e}")
+            return
+        # The opened playlist replaces the library feed: drop tracks still waiting to load, and leave a
+        # scan that is still running with a queue nobody reads
+        self.pending_tracks.clear()
+        self.scan_results = queue.Queue()
+        self.top = 0
+        self.selected_id = None
+        self.removed_at = {}
+        self.playlist_changed()
+
+    def save_playlist(self):
+        file_path = filedialog.asksaveasfilename(filetypes=PLAYLIST_FILE_TYPES, defaultextension=".m3u8")
+        if file_path:
+            try:
+                self.playlist.save(file_path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Could not save {file_path}: {e}")
+
+    @timed
+    def render_playlist(self):
+        """Fill the Treeview with just the VISIBLE_ROWS rows starting at self.top."""
+        box = self.playlist_box
+        total = len(self.playlist)
+        self.top = max(0, min(self.top, total - VISIBLE_ROWS))
+        box.delete(*box.get_children())
+        for entry_id in self.playlist[self.top:self.top + VISIBLE_ROWS]:
+            box.insert("", "end", iid=str(entry_id), values=(self.playlist.label(entry_id),))
+        if self.selected_id is not None and box.exists(str(self.selected_id)):
+            box.selection_set(str(self.selected_id))
+        if total:
+            self.playlist_scrollbar.set(self.top / total, min(1.0, (self.top + VISIBLE_ROWS) / total))
+        else:
+            self.playlist_scrollbar.set(0.0, 1.0)
+
+    def scroll_playlist(self, *args):
+        # Called by the scrollbar as ("moveto", fraction) or ("scroll", n, "units"/"pages")
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.playlist))
+        elif args[0] == "scroll":
+            self.top += int(args[1]) * (VISIBLE_ROWS if args[2] == "pages" else 1)
+        self.render_playlist()
+
+    def wheel_playlist(self, event):
+        self.scroll_playlist("scroll", -3 if event.num == 4 or event.delta > 0 else 3, "units")
+        return "break"
+
+    def remember_selection(self, event):
+        selected = self.playlist_box.selection()
+        if selected:
+            self.selected_id = int(selected[0])
+
+    def move_up(self):
+        self.move_selected(-1)
+
+    def move_down(self):
+        self.move_selected(1)
+
+    def move_selected(self, step):
+        if self.selected_id is None or not self.playlist.move(self.selected_id, step):
+            return
+        # Keep the moved row in view
+        position = self.playlist.position(self.selected_id)
+        if not self.top <= position < self.top + VISIBLE_ROWS:
+            self.top = position - (0 if step < 0 else VISIBLE_ROWS - 1)
+        self.render_playlist()
+        if self.is_playing and not self.shuffle.get():
+            self.prefetch_next()
+
+    def remove_selected(self):
+        if self.selected_id is None:
+            return
+        if self.selected_id in (self.current_id, self.queued_id):
+            # So playback can carry on with whatever took its place
+            self.removed_at[self.selected_id] = self.playlist.position(self.selected_id)
+        self.playlist.remove(self.selected_id)
+        self.selected_id = None
+        self.render_playlist()
+        if self.is_playing:
+            self.prefetch_next()
+
+    def scan_folder(self):
+        if self.scan_thread is not None and self.scan_thread.is_alive():
+            messagebox.showinfo("Scan", "A scan is already running.")
+            return
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        self.scan_counts = None
+        self.scan_thread = threading.Thread(target=self.run_scan, args=(folder, self.scan_results), daemon=True)
+        self.scan_thread.start()
+        self.schedule_load()
+
+    def run_scan(self, folder, results):
+        # Runs on the scan thread; batches reach the UI through `results`, the scan_results it started with
+        self.scan_counts = self.library.scan(folder, progress=results.put)
+
+    def schedule_load(self):
+        if self.load_job is None:
+            self.load_job = self.root.after(LOAD_INTERVAL_MS, self.load_pending)
+
+    @timed
+    def load_pending(self):
+        """Move up to LOAD_BATCH waiting tracks into the playlist, then yield to the event loop."""
+        self.load_job = None
+        while True:
+            try:
+                self.pending_tracks.extend(self.scan_results.get_nowait())
+            except queue.Empty:
+                break
+        for _ in range(min(LOAD_BATCH, len(self.pending_tracks))):
+            track = self.pending_tracks.popleft()
+            self.playlist.add(track[0], track_label(track), track[6])
+        self.render_playlist()
+
+        scanning = self.scan_thread is not None and self.scan_thread.is_alive()
+        if scanning or self.pending_tracks or not self.scan_results.empty():
+            self.status.config(text=f"{'Scanning' if scanning else 'Loading'}... {len(self.playlist)} tracks")
+            self.schedule_load()
+            return
+        self.playlist_changed()
+        counts = self.scan_counts
+        self.status.config(text=f"{len(self.playlist)} tracks" + (
+            f" ({counts['added']} new, {counts['updated']} changed, {counts['removed']} gone)" if counts else ""
+        ))
 
     def select_track(self, event):
         selected = self.playlist_box.selection()
         if selected:
-            index = self.playlist_box.index(selected[0])
-            self.current_track = self.playlist[index]
-            self.label.config(text=os.path.basename(self.current_track))
-            mixer.music.load(self.current_track)
-            self.play_music()
+            self.current_id = int(selected[0])
+            if self.shuffle.get():
+                self.playlist_changed()  # A fresh shuffle that starts from the chosen track
+            self.play_entry(self.current_id)
 
+    def play_entry(self, entry_id):
+        self.current_id = entry_id
+        self.removed_at = {}
+        self.current_track = self.playlist.path(entry_id)
+        self.label.config(text=self.playlist.label(entry_id))
+        mixer.music.load(self.current_track)
+        self.play_music()
+
+    @timed
     def play_music(self):
         if self.current_track:
             mixer.music.play()
             self.is_playing = True
-            self.track_length = mixer.Sound(self.current_track).get_length()
-            threading.Thread(target=self.update_progress, daemon=True).start()
+            self.is_paused = False
+            # Headers (or the cache) give the length at once; decoding is a last resort
+            self.track_length = self.durations.duration(self.current_track) or 0
+            if not self.track_length:
+                self.worker.submit(self.decode_length, self.current_track)
+            self.seek_offset = 0.0
+            self.last_pos_ms = 0
+            self.queued_id = None  # play() drops anything queued
+            self.show_waveform(self.current_track)
+            self.prefetch_next()
+            self.schedule_progress()
         else:
             messagebox.showwarning("Warning", "Please select a track first.")
 
+    def playlist_changed(self):
+        """Redraw the playlist and shuffle again after tracks are added or shuffle changes."""
+        self.order = []
+        self.order_position = {}
+        if self.shuffle.get():
+            self.order = list(self.playlist.ids)
+            random.shuffle(self.order)
+            # Start the shuffled order at the current track so every other track still plays
+            if self.current_id in self.playlist:
+                self.order.remove(self.current_id)
+                self.order.insert(0, self.current_id)
+            self.order_position = {entry_id: position for position, entry_id in enumerate(self.order)}
+        self.render_playlist()
+        if self.is_playing:
+            self.prefetch_next()
+
+    def cycle_repeat(self):
+        self.repeat = REPEAT_MODES[(REPEAT_MODES.index(self.repeat) + 1) % len(REPEAT_MODES)]
+        self.repeat_button.config(text=f"🔁 Repeat: {self.repeat}")
+        if self.is_playing:
+            self.prefetch_next()
+
+    def next_id(self):
+        """Entry ID of the track to play after the current one, or None at the end."""
+        removed = self.current_id not in self.playlist
+        if self.repeat == "one" and not removed:
+            return self.current_id
+        if self.shuffle.get():
+            if self.current_id not in self.order_position:
+                return None
+            order, position = self.order, self.order_position[self.current_id]
+        elif removed:
+            if self.current_id not in self.removed_at:
+                return None
+            # The entry after it moved up into its place
+            order = self.playlist.ids
+            position = min(self.removed_at[self.current_id], len(order)) - 1
+        else:
+            order, position = self.playlist.ids, self.playlist.position(self.current_id)
+        # Tracks removed since the shuffle are still in the order; skip them
+        for _ in range(len(order)):
+            position += 1
+            if position == len(order):
+                if self.repeat != "all":
+                    return None
+                position = 0
+            if order[position] in self.playlist:
+                return order[position]
+        return None
+
+    def prefetch_next(self):
+        """Get the next track ready in the background; update_progress queues it."""
+        entry_id = self.next_id()
+        if entry_id is None:
+            self.prefetch_job = None
+            return
+        self.prefetch_job = self.worker.submit(self.prefetch, entry_id, self.playlist.path(entry_id))
+
+    def prefetch(self, entry_id, track):
+        """Find a track's length and read it once, so the OS has it cached when it starts."""
+        track_length = self.durations.duration(track)
+        with open(track, "rb") as f:
+            while f.read(PREFETCH_CHUNK):
+                pass
+        return entry_id, track, track_length
+
+    def queue_prefetched(self):
+        """Hand a finished prefetch to the mixer, so it starts the moment this track ends."""
+        if self.prefetch_job is None or not self.prefetch_job.done():
+            return
+        job, self.prefetch_job = self.prefetch_job, None
+        try:
+            entry_id, track, track_length = job.result()
+        except OSError:
+            return
+        # Shuffle, repeat or the playlist may have changed while it ran
+        if entry_id != self.next_id():
+            return
+        mixer.music.queue(track)
+        self.queued_id = entry_id
+        self.queued_track = track
+        self.queued_length = track_length or 0
+
+    @timed
+    def advance(self):
+        """The queued track has taken over from the one that ended."""
+        self.current_id = self.queued_id
+        self.current_track = self.queued_track
+        if self.current_id in self.playlist:
+            self.label.config(text=self.playlist.label(self.current_id))
+        else:
+            self.label.config(text=os.path.basename(self.current_track))  # Removed while queued
+        self.track_length = self.queued_length
+        if not self.track_length:
+            self.worker.submit(self.decode_length, self.current_track)
+        self.seek_offset = 0.0
+        self.queued_id = None
+        self.show_waveform(self.current_track)
+        self.prefetch_next()
+
+    def show_waveform(self, track):
+        """Draw a track's waveform from the peak cache, or start computing it in the background."""
+        self.waveform.delete("all")
+        peaks = self.peaks.get(track)
+        if peaks is not None and len(peaks) == WAVEFORM_BINS:
+            self.draw_waveform(peaks)
+            return
+        if self.waveform_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Spawned rather than forked: this process has Tk, SDL and worker threads running
+            self.waveform_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self.waveform_job = (track, self.waveform_pool.submit(cached_peaks, track, self.peaks.cache_dir))
+
+    def check_waveform(self):
+        if self.waveform_job is None or not self.waveform_job[1].done():
+            return
+        (track, job), self.waveform_job = self.waveform_job, None
+        try:
+            peaks = job.result()
+        except Exception:
+            return  # No waveform for tracks nothing can decode; playback is unaffected
+        if track == self.current_track:
+            self.draw_waveform(peaks)
+
+    @timed
+    def draw_waveform(self, peaks):
+        middle = WAVEFORM_HEIGHT / 2
+        for x, peak in enumerate(peaks):
+            half = max(1, peak * middle / 255)
+            self.waveform.create_line(x, middle - half, x, middle + half, fill="#5a5a8a")
+        self.waveform.create_line(0, 0, 0, WAVEFORM_HEIGHT, fill="white", tags="cursor")
+
+    def seek_waveform(self, event):
+        percent = min(100, max(0, event.x / WAVEFORM_BINS * 100))
+        self.set_progress(percent)
+        self.seek_track(percent)
+
+    def decode_length(self, track):
+        try:
+            track_length = self.durations.decode(track)
+        except Exception:
+            return
+        if track == self.current_track:
+            self.track_length = track_length
+
     def pause_music(self):
+        if not self.is_playing:
+            return
         mixer.music.pause()
         self.is_playing = False
+        self.is_paused = True
+        self.cancel_progress()
 
     def resume_music(self):
+        # After Stop, or once the playlist has ended, there is nothing to unpause
+        if not self.is_paused:
+            return
         mixer.music.unpause()
         self.is_playing = True
+        self.is_paused = False
+        self.schedule_progress()
 
     def stop_music(self):
         mixer.music.stop()
         self.is_playing = False
-        self.stop_thread = True
-        self.progress.set(0)
+        self.is_paused = False
+        self.cancel_progress()
+        self.set_progress(0)
 
     def set_volume(self, volume):
         mixer.music.set_volume(float(volume))
 
     def seek_track(self, value):
-        if self.is_playing:
+        # Moving the bar ourselves also calls this; only the user's drags should seek
+        if self.is_playing and not self.setting_progress:
+            target = float(value) * self.track_length / 100
             mixer.music.rewind()
-            mixer.music.set_pos(float(value) * self.track_length / 100)
+            mixer.music.set_pos(target)
+            self.last_pos_ms = mixer.music.get_pos()
+            self.seek_offset = target - self.last_pos_ms / 1000
+
+    def position(self):
+        """Seconds into the current track."""
+        return max(0.0, self.seek_offset + mixer.music.get_pos() / 1000)
+
+    def set_progress(self, percent):
+        self.setting_progress = True
+        try:
+            self.progress.set(percent)
+        finally:
+            self.setting_progress = False
+
+    def schedule_progress(self):
+        """Start the progress updates, unless they are already running."""
+        if self.progress_job is None:
+            self.progress_job = self.root.after(self.refresh_ms, self.update_progress)
+
+    def cancel_progress(self):
+        if self.progress_job is not None:
+            self.root.after_cancel(self.progress_job)
+            self.progress_job = None
 
     def update_progress(self):
-        while self.is_playing:
-            if self.stop_thread:
-                self.stop_thread = False
-                break
-            current_time = mixer.music.get_pos() / 1000
-            self.progress.set((current_time / self.track_length) * 100 if self.track_length > 0 else 0)
-            time.sleep(1)
+        """Move the progress bar, then run again after refresh_ms while a track plays.
+
+        Runs on the Tk event loop, so there is never more than one of it and
+        no thread touches the widgets. It also queues the prefetched next
+        track and notices when the mixer moves on to it.
+        """
+        self.progress_job = None
+        if not self.is_playing:
+            return
+        if not mixer.music.get_busy():
+            # Ended before the next track was ready to queue
+            next_id = self.next_id()
+            if next_id is not None:
+                self.play_entry(next_id)
+            else:
+                self.is_playing = False
+                self.set_progress(100 if self.track_length > 0 else 0)
+            return
+        pos_ms = mixer.music.get_pos()
+        # get_pos() starts again from zero when a queued track takes over
+        if self.queued_id is not None and pos_ms < self.last_pos_ms:
+            self.advance()
+        self.last_pos_ms = pos_ms
+        self.queue_prefetched()
+        self.check_waveform()
+        percent = min(100, self.position() / self.track_length * 100) if self.track_length > 0 else 0
+        self.set_progress(percent)
+        cursor = percent * WAVEFORM_BINS / 100
+        self.waveform.coords("cursor", cursor, 0, cursor, WAVEFORM_HEIGHT)
+        self.schedule_progress()
 
 # Main application loop
 if __name__ == "__main__":
+    # Initialize the mixer (here, so worker processes that import this file don't)
+    mixer.init()
     root = tk.Tk()
+    instrument_tk(root)
     app = MusicPlayer(root)
     root.mainloop()
@@ -0,0 +1,196 @@
+import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+import sqlite3
+import sys
+import threading
+
+from AudioMetadata import CACHE_DIR, read_duration, read_tags
+from Instrumentation import timed
+
+DEFAULT_LIBRARY_PATH = os.path.join(CACHE_DIR, "library.db")
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".ogg", ".opus", ".flac"}
+SCAN_WORKERS = 16
+BATCH_SIZE = 500
+
+# Columns of the tracks table, and the order of every track tuple
+TRACK_FIELDS = ("path", "mtime", "size", "title", "artist", "album", "duration")
+
+
+def list_directory(directory):
+    """Subdirectories of a directory, (path, mtime, size) of the audio files in it, and whether it listed fully.
+
+    A listing that hit an error is incomplete, so nothing under the
+    directory should be taken as deleted because it is missing from it.
+    """
+    subdirectories, files = [], []
+    complete = True
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_mtime, stat.st_size))
+                except OSError:
+                    complete = False
+    except OSError:
+        complete = False
+    return subdirectories, files, complete
+
+
+def read_track(path, mtime, size):
+    """A track tuple with the file's tags and duration."""
+    tags = read_tags(path)
+    title = tags.get("title") or os.path.splitext(os.path.basename(path))[0]
+    return path, mtime, size, title, tags.get("artist", ""), tags.get("album", ""), read_duration(path)
+
+
+def track_label(track):
+    """How a track is shown in the playlist."""
+    title, artist = track[3], track[4]
+    return f"{artist} - {title}" if artist else title
+
+
+class MusicLibrary:
+    """An index of the audio files under some folders, kept in SQLite.
+
+    A scan lists directories and reads tags in a thread pool, which is what
+    keeps a network mount busy, and only reads files that are new or whose
+    mtime or size changed since the last scan.
+    """
+
+    def __init__(self, db_path=DEFAULT_LIBRARY_PATH):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tracks (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, "
+            "title TEXT, artist TEXT, album TEXT, duration REAL)"
+        )
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def tracks(self):
+        """Every track tuple in the library, in path order."""
+        with self.lock:
+            return self.connection.execute(f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks ORDER BY path").fetchall()
+
+    def _known(self, root):
+        """(mtime, size) of every indexed file under a folder."""
+        # Every path under root sorts between root + os.sep and the next separator character
+        low, high = root + os.sep, root + chr(ord(os.sep) + 1)
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, mtime, size FROM tracks WHERE path >= ? AND path < ?", (low, high)
+            ).fetchall()
+        return {path: (mtime, size) for path, mtime, size in rows}
+
+    def _save(self, tracks):
+        placeholders = ", ".join("?" * len(TRACK_FIELDS))
+        with self.lock, self.connection:
+            self.connection.executemany(f"INSERT OR REPLACE INTO tracks VALUES ({placeholders})", tracks)
+
+    def _forget(self, paths):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM tracks WHERE path = ?", ((path,) for path in paths))
+
+    @timed
+    def scan(self, root, workers=SCAN_WORKERS, batch_size=BATCH_SIZE, progress=None):
+        """Bring the index for a folder up to date.
+
+        New and changed tracks are saved `batch_size` at a time, and each
+        saved batch is passed to `progress`. Files that have gone are
+        dropped from the index. Returns counts of added, updated, removed
+        and unchanged tracks. Tracks under a folder that could not be
+        listed, as on a network mount that drops out, are kept.
+        """
+        root = os.path.abspath(root)
+        known = self._known(root)
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        directories = deque([root])
+        to_read = deque()
+        running = set()
+        listings = {}  # The running futures that list a directory -> that directory
+        unlisted = []  # Directories whose listing failed part way
+        batch = []
+        # Enough work queued to keep every worker busy, without a future per file
+        limit = workers * 4
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while directories or to_read or running:
+                while len(running) < limit and (to_read or directories):
+                    if to_read:
+                        future = executor.submit(read_track, *to_read.popleft())
+                    else:
+                        directory = directories.popleft()
+                        future = executor.submit(list_directory, directory)
+                        listings[future] = directory
+                    running.add(future)
+
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in listings:
+                        directory = listings.pop(future)
+                        subdirectories, files, complete = future.result()
+                        if not complete:
+                            unlisted.append(directory)
+                        directories.extend(subdirectories)
+                        for path, mtime, size in files:
+                            previous = known.pop(path, None)
+                            if previous == (mtime, size):
+                                counts["unchanged"] += 1
+                            else:
+                                counts["added" if previous is None else "updated"] += 1
+                                to_read.append((path, mtime, size))
+                    else:
+                        batch.append(future.result())
+                        if len(batch) >= batch_size:
+                            self._save(batch)
+                            if progress:
+                                progress(batch)
+                            batch = []
+
+        if batch:
+            self._save(batch)
+            if progress:
+                progress(batch)
+        # Whatever is left in known was not found on disk, unless its folder could not be listed
+        if unlisted:
+            prefixes = tuple(os.path.join(directory, "") for directory in unlisted)
+            known = [path for path in known if not path.startswith(prefixes)]
+        self._forget(known)
+        counts["removed"] = len(known)
+        return counts
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the audio files in a folder for the music player.")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--library", default=DEFAULT_LIBRARY_PATH, help=f"index file (default {DEFAULT_LIBRARY_PATH})")
+    parser.add_argument("--workers", type=int, default=SCAN_WORKERS, help=f"threads (default {SCAN_WORKERS})")
+    args = parser.parse_args(argv)
+
+    library = MusicLibrary(args.library)
+    try:
+        for folder in args.folders:
+            counts = library.scan(folder, workers=args.workers)
+            print(f"{folder}: {counts['added']} added, {counts['updated']} updated, "
+                  f"{counts['removed']} removed, {counts['unchanged']} unchanged")
+        print(f"{len(library)} tracks in the library.")
+    finally:
+        library.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
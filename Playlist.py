@@ -0,0 +1,224 @@
+from array import array
+import math
+import os
+import struct
+import sys
+
+from Instrumentation import timed
+
+BINARY_MAGIC = b"MPL1"
+PLAYLIST_FILE_TYPES = [("Playlists", "*.m3u *.m3u8 *.mpl"), ("M3U playlist", "*.m3u *.m3u8"),
+                       ("Binary playlist", "*.mpl")]
+# Characters that would split a label into extra fields (.mpl) or lines (M3U)
+LABEL_SEPARATORS = str.maketrans({"\0": " / ", "\r": " ", "\n": " "})
+
+
+class Playlist:
+    """Tracks in playlist order, each under an entry ID that never changes.
+
+    Entry IDs are what the Treeview uses as item IDs, so a selected row
+    leads straight to its track. Positions are cached and only the part
+    after a removal is recomputed, when it is next asked for.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.entries = {}  # Entry ID -> (path, label, duration or None)
+        self.by_path = {}
+        self.next_id = 1
+        self._positions = {}
+        self._valid = 0  # Cached positions below this index are correct
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, entry_id):
+        return entry_id in self.entries
+
+    def __getitem__(self, index):
+        return self.ids[index]
+
+    def path(self, entry_id):
+        return self.entries[entry_id][0]
+
+    def label(self, entry_id):
+        return self.entries[entry_id][1]
+
+    def duration(self, entry_id):
+        return self.entries[entry_id][2]
+
+    def add(self, path, label=None, duration=None):
+        """Append a track. Returns its entry ID, or None if the path is already listed."""
+        if path in self.by_path:
+            return None
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = (path, label or os.path.basename(path), duration)
+        self.by_path[path] = entry_id
+        if self._valid == len(self.ids):
+            self._positions[entry_id] = len(self.ids)
+            self._valid += 1
+        self.ids.append(entry_id)
+        return entry_id
+
+    def extend(self, entries):
+        """Append (path, label, duration) entries. Returns how many were new."""
+        count = 0
+        for path, label, duration in entries:
+            if self.add(path, label, duration) is not None:
+                count += 1
+        return count
+
+    def position(self, entry_id):
+        """Where an entry is in the playlist. Raises KeyError if it isn't."""
+        position = self._positions.get(entry_id)
+        if position is not None and position < self._valid:
+            return position
+        ids = self.ids
+        for position in range(self._valid, len(ids)):
+            self._positions[ids[position]] = position
+        self._valid = len(ids)
+        return self._positions[entry_id]
+
+    def remove(self, entry_id):
+        position = self.position(entry_id)
+        del self.ids[position]
+        del self._positions[entry_id]
+        self._valid = min(self._valid, position)
+        path = self.entries.pop(entry_id)[0]
+        del self.by_path[path]
+
+    def move(self, entry_id, step):
+        """Move an entry `step` places (-1 is up one). Returns False at either end."""
+        position = self.position(entry_id)
+        other = position + step
+        if not 0 <= other < len(self.ids):
+            return False
+        ids = self.ids
+        ids[position], ids[other] = ids[other], ids[position]
+        if max(position, other) < self._valid:
+            self._positions[ids[position]] = position
+            self._positions[ids[other]] = other
+        else:
+            self._valid = min(self._valid, position, other)
+        return True
+
+    def clear(self):
+        # Entry IDs are never reused, so an old ID can't pick out a new track
+        next_id = self.next_id
+        self.__init__()
+        self.next_id = next_id
+
+    @timed
+    def load(self, file_path):
+        """Replace the playlist with the contents of an M3U/M3U8 or .mpl file."""
+        entries = read_playlist(file_path)  # Read first, so a damaged file leaves the playlist alone
+        self.clear()
+        return self.extend(entries)
+
+    @timed
+    def save(self, file_path):
+        write_playlist(file_path, (self.entries[entry_id] for entry_id in self.ids))
+
+
+def read_m3u(file_path):
+    """(path, label, duration) entries of an M3U or M3U8 playlist."""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Old .m3u files are often in the system code page
+        text = data.decode("latin-1")
+
+    base = os.path.dirname(os.path.abspath(file_path))
+    entries = []
+    label = duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#"):
+            if line.startswith("#EXTINF:"):
+                info, _, label = line[8:].partition(",")
+                try:
+                    duration = float(info.split()[0])
+                except (ValueError, IndexError):
+                    duration = None
+                if duration is not None and duration < 0:
+                    duration = None
+            continue
+        if not os.path.isabs(line) and "://" not in line:
+            line = os.path.normpath(os.path.join(base, line))
+        entries.append((line, label or os.path.basename(line), duration))
+        label = duration = None
+    return entries
+
+
+def clean_label(label):
+    return label.translate(LABEL_SEPARATORS)
+
+
+def write_m3u(file_path, entries):
+    lines = ["#EXTM3U"]
+    for path, label, duration in entries:
+        if "\n" in path or "\r" in path:
+            raise ValueError(f"{path!r} cannot be written to an M3U playlist")
+        lines.append(f"#EXTINF:{round(duration) if duration else -1},{clean_label(label)}")
+        lines.append(path)
+    with open(file_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_binary_playlist(file_path):
+    """(path, label, duration) entries of a .mpl playlist.
+
+    The format is the magic bytes MPL1, the entry count as a little-endian
+    uint32, one float64 duration per entry (NaN when unknown), then every
+    path and label as NUL-terminated UTF-8. Raises ValueError if the
+    file doesn't hold as many entries as its count says.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError(f"{file_path} is not a binary playlist")
+    count = struct.unpack("<I", data[4:8])[0]
+    durations = array("d")
+    durations.frombytes(data[8:8 + 8 * count])
+    if sys.byteorder == "big":
+        durations.byteswap()
+    fields = data[8 + 8 * count:].decode("utf-8").split("\0")
+    # Two fields per entry, then the empty string after the last NUL
+    if len(durations) != count or len(fields) != 2 * count + 1 or fields[-1]:
+        raise ValueError(f"{file_path} is damaged: it should hold {count} entries")
+    return [(path, label, None if math.isnan(duration) else duration)
+            for path, label, duration in zip(fields[0::2], fields[1::2], durations)]
+
+
+def write_binary_playlist(file_path, entries):
+    durations = array("d")
+    text = []
+    for path, label, duration in entries:
+        durations.append(math.nan if duration is None else duration)
+        if "\0" in path:
+            raise ValueError(f"{path!r} cannot be written to a binary playlist")
+        text.append(f"{path}\0{clean_label(label)}\0")
+    if sys.byteorder == "big":
+        durations.byteswap()
+    with open(file_path, "wb") as f:
+        f.write(BINARY_MAGIC + struct.pack("<I", len(durations)))
+        f.write(durations.tobytes())
+        f.write("".join(text).encode("utf-8"))
+
+
+def read_playlist(file_path):
+    if file_path.lower().endswith(".mpl"):
+        return read_binary_playlist(file_path)
+    return read_m3u(file_path)
+
+
+def write_playlist(file_path, entries):
+    if file_path.lower().endswith(".mpl"):
+        write_binary_playlist(file_path, entries)
+    else:
+        write_m3u(file_path, entries)
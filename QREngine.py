@@ -0,0 +1,458 @@
+import argparse
+import csv
+from functools import lru_cache
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+
+import qrcode
+from qrcode.exceptions import DataOverflowError
+
+from Instrumentation import timed
+
+RENDER_CACHE_SIZE = 4096
+BATCH_CHUNK_SIZE = 256
+SHEET_PAGE = (1240, 1754)  # A4 at 150 dpi
+SHEET_GRID = (4, 6)
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v"}
+DOWNSCALE_WIDTH = 1000  # Try detection at this width first; most codes are found without full resolution
+FRAME_STEP = 5
+SCAN_CHUNK_SIZE = 16
+# Path separators, and characters Windows won't allow in a filename
+UNSAFE_FILENAME_CHARACTERS = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+_detectors = threading.local()
+
+
+def make_qrcode(data, box_size=6, border=4, version=1, fill_color="black", back_color="white"):
+    """Build the image for a QR code holding `data`."""
+    qr = qrcode.QRCode(version=version, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.make_image(fill_color=fill_color, back_color=back_color)
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_png(data, box_size=6, border=4, version=1, fill_color="black", back_color="white"):
+    """PNG bytes of a QR code, rendered in memory. Repeated payloads and options come from a cache."""
+    buffer = io.BytesIO()
+    make_qrcode(data, box_size, border, version, fill_color, back_color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def png_filename(filename):
+    return filename if filename.lower().endswith(".png") else filename + ".png"
+
+
+def save_png(png, filename):
+    """Write PNG bytes to <filename>.png and return the path."""
+    path = png_filename(filename)
+    with open(path, "wb") as f:
+        f.write(png)
+    return path
+
+
+@timed
+def generate_qrcode(data, filename, **options):
+    """Save a QR code holding `data` as <filename>.png and return the path."""
+    return save_png(render_png(data, **options), filename)
+
+
+def safe_filename(name):
+    """A CSV filename reduced to a plain name that can't point outside the output, or "" if nothing is left."""
+    name = re.split(r"[/\\]", name)[-1]
+    # Windows drops trailing dots and spaces, and "." and ".." aren't names at all
+    return UNSAFE_FILENAME_CHARACTERS.sub("_", name).strip(" .")
+
+
+def read_batch(csv_path, data_column="data", filename_column="filename"):
+    """Yield (data, filename) from a CSV with a header row.
+
+    Filenames are reduced to safe .png names, and a name that is already
+    taken gets a -2, -3, ... suffix. Rows without a filename are named
+    after their line number; rows without data are reported and skipped.
+    """
+    used = set()
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        if data_column not in (reader.fieldnames or ()):
+            raise ValueError(f"{csv_path} has no {data_column!r} column")
+        for line_number, row in enumerate(reader, start=2):
+            if row[data_column] is None:
+                print(f"{csv_path}:{line_number}: no {data_column!r} value", file=sys.stderr)
+                continue
+            filename = png_filename(safe_filename(row.get(filename_column) or "") or f"{line_number:06d}")
+            stem, copy = filename[:-len(".png")], 1
+            # Compared without case, as Windows and macOS file systems do
+            while filename.lower() in used:
+                copy += 1
+                filename = f"{stem}-{copy}.png"
+            used.add(filename.lower())
+            yield row[data_column], filename
+
+
+def _render_rows(rows, options):
+    """(filename, PNG bytes or None, error) for each row. Meant to run in a worker process."""
+    results = []
+    for data, filename in rows:
+        try:
+            results.append((png_filename(filename), render_png(data, **options), None))
+        except (ValueError, DataOverflowError) as e:
+            results.append((png_filename(filename), None, str(e) or type(e).__name__))
+    return results
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def render_batch(rows, workers=None, **options):
+    """Yield (filename, PNG bytes) for (data, filename) rows, rendered in a process pool.
+
+    Results come back in input order. Each worker keeps its own render cache.
+    Rows are read as the pool needs them, so only a few chunks are in
+    flight at once. A row that can't be rendered is reported and skipped.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from collections import deque
+
+    def finished(results):
+        for filename, png, error in results:
+            if error:
+                print(f"{filename}: could not render: {error}", file=sys.stderr)
+            else:
+                yield filename, png
+
+    if workers == 1:
+        for chunk in _chunks(rows, BATCH_CHUNK_SIZE):
+            yield from finished(_render_rows(chunk, options))
+        return
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in _chunks(rows, BATCH_CHUNK_SIZE):
+            pending.append(executor.submit(_render_rows, chunk, options))
+            while len(pending) > workers * 2 or (pending and pending[0].done()):
+                yield from finished(pending.popleft().result())
+        while pending:
+            yield from finished(pending.popleft().result())
+
+
+def write_directory(results, directory):
+    """Write each result to a file; a file that can't be written is reported and skipped."""
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for filename, png in results:
+        try:
+            with open(os.path.join(directory, filename), "wb") as f:
+                f.write(png)
+        except OSError as e:
+            print(f"{filename}: could not write: {e}", file=sys.stderr)
+            continue
+        count += 1
+    return count
+
+
+def write_zip(results, zip_path):
+    count = 0
+    # PNG is already compressed, so the archive only stores it
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as archive:
+        for filename, png in results:
+            archive.writestr(filename, png)
+            count += 1
+    return count
+
+
+def label_sheets(results, grid=SHEET_GRID):
+    """Lay codes out on printable A4 label sheets, each captioned with its filename.
+
+    Yields ("sheet-00001.png", PNG bytes) per page, so only one page is
+    ever held in memory and the sheets can go to a ZIP or a directory.
+    """
+    from PIL import Image, ImageDraw
+
+    columns, rows = grid
+    cell_width, cell_height = SHEET_PAGE[0] // columns, SHEET_PAGE[1] // rows
+    size = min(cell_width, cell_height - 30)
+    page, draw, count = None, None, 0
+
+    def finish_page():
+        buffer = io.BytesIO()
+        page.save(buffer, format="PNG", dpi=(150, 150))
+        return f"sheet-{(count - 1) // (columns * rows) + 1:05d}.png", buffer.getvalue()
+
+    for filename, png in results:
+        slot = count % (columns * rows)
+        if slot == 0:
+            if page is not None:
+                yield finish_page()
+            page = Image.new("L", SHEET_PAGE, 255)
+            draw = ImageDraw.Draw(page)
+        x, y = slot % columns * cell_width, slot // columns * cell_height
+        code = Image.open(io.BytesIO(png)).convert("L").resize((size, size), Image.NEAREST)
+        page.paste(code, (x + (cell_width - size) // 2, y))
+        draw.text((x + 10, y + size + 5), os.path.splitext(filename)[0], fill=0)
+        count += 1
+    if page is not None:
+        yield finish_page()
+
+
+@timed
+def write_batch(results, output, sheets=False):
+    """Write rendered codes (or label sheets of them) to a .zip or a directory of PNGs."""
+    if sheets:
+        results = label_sheets(results)
+    if output.lower().endswith(".zip"):
+        return write_zip(results, output)
+    return write_directory(results, output)
+
+
+def get_detector():
+    """This thread's QR detector, created once and reused for every image it scans."""
+    import cv2
+
+    detector = getattr(_detectors, "detector", None)
+    if detector is None:
+        detector = _detectors.detector = cv2.QRCodeDetector()
+    return detector
+
+
+def decode_image(image, downscale_width=DOWNSCALE_WIDTH):
+    """Every QR code found in an image array, as a list of strings.
+
+    Large images are tried at `downscale_width` first and only searched at
+    full resolution when that finds nothing or cannot decode a code it found.
+    """
+    import cv2
+
+    detector = get_detector()
+    height, width = image.shape[:2]
+    if downscale_width and width > downscale_width:
+        scale = downscale_width / width
+        small = cv2.resize(image, (downscale_width, max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+        found, decoded, _, _ = detector.detectAndDecodeMulti(small)
+        if found and all(decoded):
+            return list(decoded)
+    found, decoded, _, _ = detector.detectAndDecodeMulti(image)
+    return [data for data in decoded if data] if found else []
+
+
+@timed
+def decode_image_bytes(image_bytes, downscale_width=DOWNSCALE_WIDTH):
+    """Every QR code in an encoded image (PNG, JPEG, ...) held in memory."""
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("Could not read an image from the data given")
+    return decode_image(image, downscale_width)
+
+
+def detect_qrcode(image_file):
+    """Decode the QR code in an image file, returning "" if none is found."""
+    import cv2
+
+    image = cv2.imread(image_file, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not read an image from {image_file}")
+    codes = decode_image(image)
+    return codes[0] if codes else ""
+
+
+def scan_image_file(image_file, downscale_width=DOWNSCALE_WIDTH):
+    """A result record for one image file. Meant to run in a worker process."""
+    import cv2
+
+    start = time.perf_counter()
+    image = cv2.imread(image_file, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return {"source": image_file, "error": "not a readable image"}
+    codes = decode_image(image, downscale_width)
+    return {"source": image_file, "codes": codes, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def iter_image_files(root):
+    for directory, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(directory, filename)
+
+
+def scan_images(image_files, workers=None, downscale_width=DOWNSCALE_WIDTH):
+    """Yield a result record per image file, scanned in a process pool in input order."""
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    scan = partial(scan_image_file, downscale_width=downscale_width)
+    if workers == 1:
+        yield from map(scan, image_files)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(scan, image_files, chunksize=SCAN_CHUNK_SIZE)
+
+
+def scan_video(video_file, frame_step=FRAME_STEP, workers=None, downscale_width=DOWNSCALE_WIDTH):
+    """Yield a result record for every scanned video frame that holds a QR code.
+
+    Only every `frame_step`th frame is decoded; the others are grabbed and
+    skipped. Frames are searched in a thread pool, each thread with its
+    own detector, while this thread keeps reading the video.
+    """
+    import cv2
+    from concurrent.futures import ThreadPoolExecutor
+    from collections import deque
+
+    capture = cv2.VideoCapture(video_file)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open a video from {video_file}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+
+    def scan_frame(frame_number, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame_number, decode_image(gray, downscale_width)
+
+    def record(frame_number, codes):
+        return {"source": video_file, "frame": frame_number,
+                "seconds": round(frame_number / fps, 3) if fps else None, "codes": codes}
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frame_number = 0
+            while capture.grab():
+                if frame_number % frame_step == 0:
+                    found, frame = capture.retrieve()
+                    if found:
+                        pending.append(executor.submit(scan_frame, frame_number, frame))
+                frame_number += 1
+                # Keep a few frames in flight, not the whole video
+                while len(pending) > workers * 2 or (pending and pending[0].done()):
+                    number, codes = pending.popleft().result()
+                    yield record(number, codes)
+            while pending:
+                number, codes = pending.popleft().result()
+                yield record(number, codes)
+    finally:
+        capture.release()
+
+
+@timed
+def write_scan_results(records, out, frames_only_with_codes=True):
+    """Write result records as JSON Lines and return throughput stats."""
+    start = time.perf_counter()
+    stats = {"scanned": 0, "with_codes": 0, "codes": 0, "errors": 0}
+    for record in records:
+        stats["scanned"] += 1
+        codes = record.get("codes", [])
+        stats["codes"] += len(codes)
+        stats["with_codes"] += bool(codes)
+        stats["errors"] += "error" in record
+        if "frame" in record and frames_only_with_codes and not codes:
+            continue
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["per_second"] = round(stats["scanned"] / stats["seconds"], 1) if stats["seconds"] else None
+    return stats
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and detect QR codes without a display.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="save a QR code as a PNG")
+    generate_parser.add_argument("data")
+    generate_parser.add_argument("filename", help="output file; .png is added if missing")
+    generate_parser.add_argument("--box-size", type=int, default=6)
+    generate_parser.add_argument("--border", type=int, default=4)
+
+    batch_parser = commands.add_parser("batch", help="render a QR code for every row of a CSV")
+    batch_parser.add_argument("csv_file", help='CSV with a header row and "data" and "filename" columns')
+    batch_parser.add_argument("output", help="a .zip or a directory")
+    batch_parser.add_argument("--sheets", action="store_true", help="write A4 label sheets instead of single codes")
+    batch_parser.add_argument("--workers", type=int, help="processes (default: one per CPU)")
+    batch_parser.add_argument("--data-column", default="data")
+    batch_parser.add_argument("--filename-column", default="filename")
+    batch_parser.add_argument("--box-size", type=int, default=6)
+    batch_parser.add_argument("--border", type=int, default=4)
+
+    detect_parser = commands.add_parser("detect", help="print the data in a QR code image")
+    detect_parser.add_argument("image_file")
+
+    scan_parser = commands.add_parser("scan", help="find every QR code in a directory of images or a video")
+    scan_parser.add_argument("path", help="a directory (searched recursively), an image or a video file")
+    scan_parser.add_argument("--output", help="JSON Lines file for the results (default: standard output)")
+    scan_parser.add_argument("--workers", type=int, help="processes for images, threads for video (default: CPUs)")
+    scan_parser.add_argument("--frame-step", type=positive_int, default=FRAME_STEP, help=f"scan every Nth video frame "
+                             f"(default {FRAME_STEP})")
+    scan_parser.add_argument("--full-resolution", action="store_true", help="skip the downscaled first pass")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "generate":
+            print(generate_qrcode(args.data, args.filename, box_size=args.box_size, border=args.border))
+        elif args.command == "batch":
+            start = time.perf_counter()
+            rows = read_batch(args.csv_file, args.data_column, args.filename_column)
+            results = render_batch(rows, args.workers, box_size=args.box_size, border=args.border)
+            rendered = [0]
+
+            def counted(results):
+                for result in results:
+                    rendered[0] += 1
+                    yield result
+
+            files = write_batch(counted(results), args.output, args.sheets)
+            seconds = time.perf_counter() - start
+            print(f"Rendered {rendered[0]} QR codes into {files} files in {args.output} in {seconds:.1f}s "
+                  f"({rendered[0] / seconds if seconds else 0:.0f}/s).")
+        elif args.command == "scan":
+            downscale_width = None if args.full_resolution else DOWNSCALE_WIDTH
+            extension = os.path.splitext(args.path)[1].lower()
+            if os.path.isdir(args.path):
+                records = scan_images(iter_image_files(args.path), args.workers, downscale_width)
+            elif extension in VIDEO_EXTENSIONS:
+                records = scan_video(args.path, args.frame_step, args.workers, downscale_width)
+            else:
+                records = scan_images([args.path], 1, downscale_width)
+            if args.output:
+                with open(args.output, "w", encoding="utf-8") as out:
+                    stats = write_scan_results(records, out)
+            else:
+                stats = write_scan_results(records, sys.stdout)
+            print(json.dumps({"stats": stats}), file=sys.stderr)
+        elif args.command == "detect":
+            data = detect_qrcode(args.image_file)
+            if not data:
+                print("No QR code found.", file=sys.stderr)
+                return 1
+            print(data)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import wave
+
+from AudioMetadata import CACHE_DIR
+
+DEFAULT_PEAK_DIR = os.path.join(CACHE_DIR, "peaks")
+WAVEFORM_BINS = 500
+BLOCKS_PER_SECOND = 100  # Peak resolution kept while decoding, before binning
+CHUNK_FRAMES = 1 << 16
+FFMPEG_RATE = 8000  # Plenty for peaks, and keeps the pipe small
+WAV_DTYPES = {1: "u1", 2: "<i2", 4: "<i4"}
+
+
+def wav_chunks(file_path):
+    """Yield (samples, sample rate) from a PCM WAV file, CHUNK_FRAMES at a time."""
+    import numpy as np
+
+    with wave.open(file_path, "rb") as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        dtype = WAV_DTYPES[width]
+        while True:
+            frames = w.readframes(CHUNK_FRAMES)
+            if not frames:
+                break
+            samples = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+            if width == 1:
+                samples -= 128  # 8-bit WAV is unsigned
+            yield np.abs(samples.reshape(-1, channels)).max(axis=1), rate
+
+
+def ffmpeg_chunks(file_path, ffmpeg):
+    """Yield (samples, sample rate) decoded by ffmpeg as mono 16-bit PCM through a pipe."""
+    import numpy as np
+
+    command = [ffmpeg, "-v", "quiet", "-i", file_path, "-f", "s16le", "-ac", "1", "-ar", str(FFMPEG_RATE), "-"]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL) as process:
+        while True:
+            data = process.stdout.read(CHUNK_FRAMES * 2)
+            if not data:
+                break
+            yield np.abs(np.frombuffer(data[:len(data) // 2 * 2], dtype="<i2").astype(np.float32)), FFMPEG_RATE
+    if process.returncode:
+        raise ValueError(f"ffmpeg could not decode {file_path}")
+
+
+def pygame_chunks(file_path):
+    """Yield (samples, sample rate) by decoding the whole file with pygame. The last resort."""
+    import numpy as np
+
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")  # This runs in a worker process
+    import pygame
+
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    rate = pygame.mixer.get_init()[0]
+    samples = pygame.sndarray.array(pygame.mixer.Sound(file_path)).astype(np.float32)
+    if samples.ndim > 1:
+        samples = np.abs(samples).max(axis=1)
+    for start in range(0, len(samples), CHUNK_FRAMES):
+        yield np.abs(samples[start:start + CHUNK_FRAMES]), rate
+
+
+def pcm_chunks(file_path):
+    """Stream a track's absolute sample values, using the cheapest decoder that can read it."""
+    if file_path.lower().endswith(".wav"):
+        try:
+            with wave.open(file_path, "rb") as w:
+                streamable = w.getsampwidth() in WAV_DTYPES
+        except (wave.Error, EOFError):
+            streamable = False
+        if streamable:
+            return wav_chunks(file_path)
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        return ffmpeg_chunks(file_path, ffmpeg)
+    return pygame_chunks(file_path)
+
+
+def compute_peaks(file_path, bins=WAVEFORM_BINS):
+    """`bins` peak levels across a track, scaled so the loudest is 255.
+
+    Decoding is streamed and each chunk is reduced to BLOCKS_PER_SECOND
+    peaks straight away, so memory depends on the track's length in
+    seconds, not on its sample count.
+    """
+    import numpy as np
+
+    blocks = []
+    for samples, rate in pcm_chunks(file_path):
+        block = max(1, rate // BLOCKS_PER_SECOND)
+        whole = len(samples) // block * block
+        if whole:
+            blocks.append(samples[:whole].reshape(-1, block).max(axis=1))
+        if whole < len(samples):
+            blocks.append(samples[whole:].max(keepdims=True))
+    if not blocks:
+        return bytes(bins)
+
+    peaks = np.concatenate(blocks)
+    edges = np.linspace(0, len(peaks), bins + 1).astype(np.int64)[:-1]
+    binned = np.maximum.reduceat(peaks, np.minimum(edges, len(peaks) - 1))
+    loudest = binned.max()
+    if loudest > 0:
+        binned = binned / loudest * 255
+    return binned.astype(np.uint8).tobytes()
+
+
+class PeakCache:
+    """Waveform peaks on disk, one small file per track version (path, mtime and size)."""
+
+    def __init__(self, cache_dir=DEFAULT_PEAK_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, file_path):
+        stat = os.stat(file_path)
+        key = f"{file_path}|{stat.st_mtime}|{stat.st_size}".encode("utf-8", "surrogatepass")
+        return os.path.join(self.cache_dir, hashlib.sha1(key).hexdigest() + ".peaks")
+
+    def get(self, file_path):
+        """Cached peaks for a track, or None."""
+        try:
+            with open(self._cache_path(file_path), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, file_path, peaks):
+        cache_path = self._cache_path(file_path)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(peaks)
+        os.replace(temp_path, cache_path)
+
+
+def cached_peaks(file_path, cache_dir=DEFAULT_PEAK_DIR, bins=WAVEFORM_BINS):
+    """Peaks from the cache, computing and saving them first if need be. Meant for a worker process."""
+    cache = PeakCache(cache_dir)
+    peaks = cache.get(file_path)
+    if peaks is None or len(peaks) != bins:
+        peaks = compute_peaks(file_path, bins)
+        cache.put(file_path, peaks)
+    return peaks
@@ -0,0 +1,54 @@
+import unittest
+
+from AssetStore import AssetStore, SQLiteAssetStore
+
+ASSETS = [
+    {"Item ID": 1, "Item Name": "HP Elitebook 840 G8", "Item Type": "Laptop", "In-use": False, "Serial Number": 1,
+     "Price": 750.00, "Location": "IT", "Date added": "01-01-2024"},
+    {"Item ID": 2, "Item Name": "Zebra MC3300", "Item Type": "Scanner", "In-use": True, "Serial Number": 2,
+     "Price": 500.00, "Location": "Pick", "Date added": "14-02-2020"},
+    {"Item ID": 3, "Item Name": "Dell Latitude", "Item Type": "Laptop", "In-use": True, "Serial Number": 3,
+     "Price": 900.00, "Location": "IT", "Date added": "03-05-2022"},
+]
+
+
+class InUseSearchTest(unittest.TestCase):
+    """The in-memory and SQLite stores answer In-use searches the same way."""
+
+    def setUp(self):
+        self.memory = AssetStore()
+        self.sqlite = SQLiteAssetStore(":memory:")
+        for store in (self.memory, self.sqlite):
+            store.add_many(dict(item) for item in ASSETS)
+
+    def tearDown(self):
+        self.sqlite.close()
+
+    def assertSameResults(self, query, expected):
+        self.assertEqual(sorted(self.memory.search(query)), expected, f"AssetStore, {query!r}")
+        self.assertEqual(sorted(self.sqlite.search(query)), expected, f"SQLiteAssetStore, {query!r}")
+
+    def test_true_spellings(self):
+        for value in ("true", "True", "yes", "1"):
+            self.assertSameResults(f"In-use={value}", [2, 3])
+
+    def test_false_spellings(self):
+        for value in ("false", "FALSE", "no", "0"):
+            self.assertSameResults(f"In-use={value}", [1])
+
+    def test_unrecognised_value_matches_nothing(self):
+        for value in ("maybe", "2", ""):
+            self.assertSameResults(f"In-use={value}", [])
+
+    def test_combined_with_other_fields(self):
+        self.assertSameResults("Location=IT, In-use=yes", [3])
+        self.assertSameResults("Item Type=laptop, In-use=0", [1])
+
+    def test_free_words(self):
+        self.assertSameResults("yes", [2, 3])
+        self.assertSameResults("1", [1, 2, 3])
+        self.assertSameResults("maybe", [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import importlib.util
+import os
+import queue
+import tempfile
+import unittest
+from collections import deque
+from types import SimpleNamespace
+from unittest import mock
+
+from Playlist import Playlist, write_playlist
+
+PLAYER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Music player.py")
+
+
+def load_player_module():
+    spec = importlib.util.spec_from_file_location("music_player", PLAYER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeRoot:
+    def after(self, ms, func):
+        return object()
+
+
+class OpenPlaylistTest(unittest.TestCase):
+    """Opening a playlist stops library tracks from loading into it."""
+
+    def setUp(self):
+        try:
+            self.module = load_player_module()
+        except ImportError as e:
+            self.skipTest(f"Music player needs {e.name}")
+        self.directory = tempfile.TemporaryDirectory()
+        self.playlist_path = os.path.join(self.directory.name, "opened.m3u8")
+        write_playlist(self.playlist_path, [(os.path.join(self.directory.name, "opened.mp3"), "Opened", 60.0)])
+
+        # Just the state open_playlist and load_pending use, without a window
+        player = self.module.MusicPlayer.__new__(self.module.MusicPlayer)
+        player.root = FakeRoot()
+        player.playlist = Playlist()
+        player.pending_tracks = deque()
+        player.scan_results = queue.Queue()
+        player.scan_thread = None
+        player.scan_counts = None
+        player.load_job = None
+        player.status = mock.Mock()
+        player.render_playlist = lambda: None
+        player.playlist_changed = lambda: None
+        self.player = player
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def library_track(self, name):
+        # A row as MusicLibrary.tracks() returns it, in TRACK_FIELDS order
+        return (os.path.join(self.directory.name, name), 0.0, 0, name, "", "", 30.0)
+
+    def open_playlist(self):
+        with mock.patch.object(self.module.filedialog, "askopenfilename", return_value=self.playlist_path):
+            self.player.open_playlist()
+
+    def test_waiting_library_tracks_are_dropped(self):
+        self.player.pending_tracks.extend(self.library_track(f"{n}.mp3") for n in range(3))
+        self.open_playlist()
+        self.player.load_pending()
+        self.assertEqual([self.player.playlist.path(i) for i in self.player.playlist.ids],
+                         [os.path.join(self.directory.name, "opened.mp3")])
+
+    def test_running_scan_no_longer_feeds_the_playlist(self):
+        results = self.player.scan_results  # What a scan started before the open keeps putting batches into
+        self.open_playlist()
+        results.put([self.library_track("scanned.mp3")])
+        self.player.load_pending()
+        self.assertEqual(len(self.player.playlist), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()